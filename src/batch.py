@@ -0,0 +1,116 @@
+# Ejecucion por lotes
+#
+# Compila un programa una sola vez para la maquina de pila y lo ejecuta
+# sobre muchos registros de entrada. Cada registro es un dict
+# nombre -> valor (una fila CSV o una linea NDJSON) que se asigna a las
+# variables globales del mismo nombre antes de ejecutar.
+#
+# Entre registros `data` vuelve a sus valores iniciales con una copia de
+# lista, sin tocar el front end ni el generador de codigo, y lo que imprime
+# el programa para cada registro sale como una linea en `out`.
+from errors import CompilerError
+from init import consts, install, lookup
+from irgenerator import CodeGenerator
+from vm import *
+
+import contextlib
+import csv
+import itertools
+import json
+import peephole
+import sys
+
+# names bound from the records must be plain variables when parsing
+def declare(names):
+    for name in names:
+        sym = lookup(name)
+        if sym is None:
+            install(name, 'VAR')
+        elif name in consts or sym.type not in ('VAR', 'UNDEF'):
+            raise CompilerError(f"'{name}' no se puede usar como entrada")
+        else:
+            sym.type = 'VAR'
+
+class BatchProgram:
+    '''
+    Programa ya generado en una maquina (por omision vm.machine), listo
+    para ejecutarse una vez por registro con run().
+    '''
+
+    def __init__(self, inputs=(), m=None):
+        self.machine = machine if m is None else m
+        self.initial = list(self.machine.data)
+        slots = {sym.name: slot for slot, sym in enumerate(self.machine.symbols)}
+        # inputs the program never mentions are ignored
+        self.inputs = {name: slots[name] for name in inputs if name in slots}
+
+    @classmethod
+    def generate(cls, model, inputs=(), optimize=True):
+        initcode()
+        CodeGenerator.generate(model)
+        if optimize:
+            peephole.optimize()
+        return cls(inputs)
+
+    @classmethod
+    def from_source(cls, source, inputs=(), optimize=True):
+        from minic import Lexer, Parser
+        from optimizer import ConstantFolder
+        declare(inputs)
+        model = Parser().parse(Lexer().tokenize(source))
+        if optimize:
+            model = ConstantFolder.optimize(model)
+        return cls.generate(model, inputs, optimize)
+
+    def bind(self, record):
+        data = self.machine.data
+        data[:] = self.initial
+        for name, slot in self.inputs.items():
+            value = record.get(name)
+            if value is not None and value != '':
+                try:
+                    data[slot] = float(value)
+                except (TypeError, ValueError):
+                    raise CompilerError(f"valor no numérico para '{name}': {value!r}")
+
+    def run(self, record):
+        self.bind(record)
+        self.machine.stack.clear()
+        self.machine.frame.clear()
+        self.machine.execute()
+
+    def run_all(self, records, out=None):
+        if out is None:
+            out = sys.stdout
+        with contextlib.redirect_stdout(out):
+            for record in records:
+                self.run(record)
+                out.write('\n')
+
+# records of an input stream, format 'csv' or 'ndjson'
+def read_records(f, fmt='csv'):
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+    elif fmt == 'ndjson':
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise CompilerError(f'formato de entrada desconocido {fmt}')
+
+# format from the file name, csv unless it looks like NDJSON
+def guess_format(filename):
+    if filename.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return 'csv'
+
+# records and the names of the input variables, taken from the first one
+def open_records(f, fmt='csv'):
+    records = read_records(f, fmt)
+    try:
+        first = next(records)
+    except StopIteration:
+        return iter(()), []
+    except (ValueError, csv.Error) as e:
+        raise CompilerError(f'entrada invalida: {e}')
+    return itertools.chain([first], records), list(first)
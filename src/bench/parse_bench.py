@@ -0,0 +1,69 @@
+# parse_bench.py
+#
+# Rendimiento del análisis sintáctico sobre fuentes sintéticas grandes.
+#
+# Genera programas MiniC de N sentencias, mide lexer + parser y comprueba
+# que el tiempo por sentencia no crezca con N (el parser debe ser lineal).
+# Termina con código 1 si la sentencia media del tamaño mayor cuesta más
+# de --tolerance veces la del menor.
+#
+#   python bench/parse_bench.py
+#   python bench/parse_bench.py --sizes 5000 20000 80000 --repeat 3
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from minic import Lexer, Parser
+
+def synthetic(n):
+	'''
+	Programa de n sentencias de primer nivel: asignaciones, prints y
+	bloques while/if con cuerpo, para ejercitar list, stmtlist y prlist.
+	'''
+	lines = []
+	for i in range(n):
+		k = i % 4
+		if k == 0:
+			lines.append(f'x{i % 50} = {i} * 2 + y{i % 7} - 1')
+		elif k == 1:
+			lines.append(f'print x{i % 50}, "a", {i}, y{i % 7}')
+		elif k == 2:
+			lines.append(f'while (x{i % 50} < {i}) {{ x{i % 50} += 1 y{i % 7}++ }}')
+		else:
+			lines.append(f'if (x{i % 50} > {i}) {{ z = sqrt({i}) }} else {{ z = 0 }}')
+	return '\n'.join(lines) + '\n'
+
+def parse_time(source, repeat):
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		Parser().parse(Lexer().tokenize(source))
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def main():
+	parser = argparse.ArgumentParser(description='MiniC parse throughput')
+	parser.add_argument('--sizes', type=int, nargs='+',
+		default=[2000, 8000, 32000])
+	parser.add_argument('--repeat', type=int, default=3)
+	parser.add_argument('--tolerance', type=float, default=2.0)
+	args = parser.parse_args()
+
+	per_stmt = []
+	for n in args.sizes:
+		t = parse_time(synthetic(n), args.repeat)
+		per_stmt.append(t / n)
+		print(f'{n:>8} stmts  {t:8.3f} s  {n / t:10.0f} stmts/s')
+
+	ratio = per_stmt[-1] / per_stmt[0]
+	print(f'cost per statement, largest / smallest: {ratio:.2f}')
+	if ratio > args.tolerance:
+		print('parse time is growing faster than linear')
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,227 @@
+# run_bench.py
+#
+# Suite de rendimiento del compilador y de los backends.
+#
+# Cada carga (los .mc de bench/workloads y los fuentes generados: large
+# para estresar lexer y parser, deep para anidamiento profundo de if/while)
+# se compila y ejecuta --repeat veces despues de --warmup vueltas sin medir,
+# tomando por separado el tiempo de cada fase: lex, parse, codegen (plegado
+# de constantes, generacion y peephole) y execute. Se informa la mediana y
+# la desviacion estandar de cada fase, y con --json el resultado completo
+# (commit, version de Python, tiempos crudos) para comparar commits y
+# backends.
+#
+#   python bench/run_bench.py
+#   python bench/run_bench.py --backend stack closure --repeat 7 --json out.json
+#   python bench/run_bench.py --workload sieve large --no-optimize
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from init import constpool, predefined
+from irgenerator import CodeGenerator, RegisterGenerator
+from minic import Lexer, Parser
+from model import SymbolTable
+from optimizer import ConstantFolder
+from parse_bench import synthetic
+from vm import Machine
+
+import peephole
+
+WORKLOADS = os.path.join(os.path.dirname(__file__), 'workloads')
+BACKENDS = ('stack', 'register', 'closure', 'python')
+PHASES = ('lex', 'parse', 'codegen', 'execute')
+
+def deep(depth):
+	'''
+	Programa con if/while anidados depth niveles: cada nivel es un while
+	de dos vueltas con un if/else dentro, y el cuerpo mas interno cuenta.
+	'''
+	lines = ['hits = 0']
+	for d in range(depth):
+		pad = '  ' * d
+		lines.append(f'{pad}i{d} = 0')
+		lines.append(f'{pad}while (i{d} < 2) {{ i{d}++')
+		lines.append(f'{pad}if (i{d} % 2 == {d % 2}) {{ hits += 0 }} else {{')
+	lines.append('  ' * depth + 'hits++')
+	for d in reversed(range(depth)):
+		pad = '  ' * d
+		lines.append(f'{pad}}} }}')
+	lines.append('print hits')
+	return '\n'.join(lines) + '\n'
+
+def large(n):
+	'''
+	Fuente sintetico de parse_bench, con sus variables inicializadas para
+	que el codigo generado tambien se ejecute sin avisos.
+	'''
+	init = [f'x{i} = {i}' for i in range(50)] + [f'y{i} = {i}' for i in range(7)]
+	return '\n'.join(init) + '\n' + synthetic(n)
+
+def generated():
+	return {
+		'large': lambda: large(20000),
+		'deep':  lambda: deep(12),
+	}
+
+def workloads():
+	loads = {}
+	for name in sorted(os.listdir(WORKLOADS)):
+		if name.endswith('.mc'):
+			with open(os.path.join(WORKLOADS, name)) as f:
+				loads[name[:-3]] = f.read()
+	for name, make in generated().items():
+		loads[name] = make()
+	return loads
+
+def compile_for(backend, top, optimize):
+	'''
+	Genera el codigo de top para backend y devuelve la funcion que lo ejecuta.
+	'''
+	if backend == 'register':
+		import regvm
+		rc = RegisterGenerator.generate(top)
+		return lambda: regvm.run(rc)
+	if backend == 'closure':
+		import closures
+		return closures.ClosureGenerator.generate(top)
+	if backend == 'python':
+		import pygenerator
+		pycode = pygenerator.PythonGenerator.generate(top)
+		pygenerator.clear_cache()
+		pygenerator.compile_source(pycode.source)
+		return lambda: pygenerator.run(pycode)
+	m = Machine(consts=constpool.values)
+	CodeGenerator.generate(top, m)
+	if optimize:
+		peephole.optimize(m.prog, m.lines)
+	return m.execute
+
+def run_once(source, backend, optimize):
+	'''
+	Una vuelta completa sobre simbolos y constantes nuevos, para que los
+	valores que deja una ejecucion no cambien la siguiente.
+	'''
+	constpool.clear()
+	lexer = Lexer(SymbolTable(predefined))
+	times = {}
+	clock = time.perf_counter
+
+	start = clock()
+	tokens = list(lexer.tokenize(source))
+	times['lex'] = clock() - start
+
+	start = clock()
+	top = Parser().parse(iter(tokens))
+	times['parse'] = clock() - start
+
+	start = clock()
+	if optimize:
+		top = ConstantFolder.optimize(top)
+	run = compile_for(backend, top, optimize)
+	times['codegen'] = clock() - start
+
+	out = io.StringIO()
+	start = clock()
+	with contextlib.redirect_stdout(out):
+		run()
+	times['execute'] = clock() - start
+	return times, out.getvalue()
+
+def summary(runs):
+	return {
+		'median': statistics.median(runs),
+		'stdev': statistics.stdev(runs) if len(runs) > 1 else 0.0,
+		'min': min(runs),
+		'runs': runs,
+	}
+
+def measure(source, backend, optimize, warmup, repeat):
+	for _ in range(warmup):
+		run_once(source, backend, optimize)
+	runs = {phase: [] for phase in PHASES}
+	output = None
+	for _ in range(repeat):
+		times, output = run_once(source, backend, optimize)
+		for phase in PHASES:
+			runs[phase].append(times[phase])
+	totals = [sum(t) for t in zip(*runs.values())]
+	return {
+		'phases': {phase: summary(runs[phase]) for phase in PHASES},
+		'total': summary(totals),
+		'output': output.strip()[-200:],
+	}
+
+def commit():
+	try:
+		return subprocess.run(['git', 'describe', '--always', '--dirty'],
+			cwd=os.path.dirname(os.path.abspath(__file__)),
+			capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def main():
+	loads = workloads()
+	parser = argparse.ArgumentParser(description='MiniC benchmark suite')
+	parser.add_argument('--workload', '-w', nargs='+', choices=sorted(loads),
+		default=sorted(loads))
+	parser.add_argument('--backend', '-b', nargs='+', choices=BACKENDS,
+		default=['stack'])
+	parser.add_argument('--warmup', type=int, default=1)
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--no-optimize', dest='optimize', action='store_false')
+	parser.add_argument('--json', metavar='FILE',
+		help="write the results as JSON to FILE ('-' for stdout)")
+	args = parser.parse_args()
+	if args.repeat < 1:
+		parser.error('--repeat must be at least 1')
+
+	# los programas profundos anidan visitantes recursivos
+	sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+	results = []
+	report = sys.stderr if args.json == '-' else sys.stdout
+	print(f'{"workload":<10} {"backend":<9}' +
+		''.join(f' {phase + " ms":>12}' for phase in PHASES) +
+		f' {"total ms":>12} {"stdev":>8}', file=report)
+	for name in args.workload:
+		for backend in args.backend:
+			r = measure(loads[name], backend, args.optimize, args.warmup, args.repeat)
+			r.update(workload=name, backend=backend)
+			results.append(r)
+			print(f'{name:<10} {backend:<9}' +
+				''.join(f' {r["phases"][phase]["median"] * 1e3:>12.3f}' for phase in PHASES) +
+				f' {r["total"]["median"] * 1e3:>12.3f} {r["total"]["stdev"] * 1e3:>8.3f}',
+				file=report)
+
+	if args.json:
+		doc = {
+			'commit': commit(),
+			'python': platform.python_version(),
+			'implementation': platform.python_implementation(),
+			'machine': platform.machine(),
+			'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+			'optimize': args.optimize,
+			'warmup': args.warmup,
+			'repeat': args.repeat,
+			'results': results,
+		}
+		if args.json == '-':
+			json.dump(doc, sys.stdout, indent=2)
+			print()
+		else:
+			with open(args.json, 'w') as f:
+				json.dump(doc, f, indent=2)
+				f.write('\n')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,78 @@
+# startup_bench.py
+#
+# Tiempo de arranque del compilador para un script mínimo.
+#
+# Ejecuta `python -X importtime minic.py <script>` varias veces, informa
+# la mediana del tiempo total y los módulos que más tardan en importarse,
+# y termina con código 1 si compilar y ejecutar cargó alguno de los
+# módulos que solo hacen falta para --tokens/--ast (rich, graphviz, PIL).
+#
+#   python bench/startup_bench.py
+#   python bench/startup_bench.py --repeat 20 --backend closure
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE  = os.path.dirname(os.path.abspath(__file__))
+MINIC = os.path.join(HERE, '..', 'minic.py')
+
+# solo se deben importar bajo demanda
+LAZY = ('rich', 'graphviz', 'PIL')
+
+def run(script, backend):
+	cmd = [sys.executable, '-X', 'importtime', MINIC, '-b', backend, script]
+	start = time.perf_counter()
+	proc = subprocess.run(cmd, capture_output=True, text=True,
+		cwd=os.path.dirname(MINIC))
+	elapsed = time.perf_counter() - start
+	if proc.returncode:
+		sys.exit(proc.stderr)
+	return elapsed, proc.stderr
+
+# [(module, depth, self_us, cumulative_us)] from -X importtime output
+def importtimes(stderr):
+	mods = []
+	for line in stderr.splitlines():
+		if not line.startswith('import time:') or 'self [us]' in line:
+			continue
+		self_us, cumulative, name = line[len('import time:'):].split('|')
+		depth = (len(name) - len(name.lstrip()) - 1) // 2
+		mods.append((name.strip(), depth, int(self_us), int(cumulative)))
+	return mods
+
+def main():
+	parser = argparse.ArgumentParser(description='MiniC startup time')
+	parser.add_argument('--repeat', type=int, default=10)
+	parser.add_argument('--backend', '-b', default='stack')
+	parser.add_argument('--top', type=int, default=10)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		script = os.path.join(tmp, 'tiny.mc')
+		with open(script, 'w') as f:
+			f.write('x = 1\nprint x + 1, "\\n"\n')
+		run(script, args.backend)          # warm up: tables and .pyc
+		times, stderr = [], ''
+		for _ in range(args.repeat):
+			elapsed, stderr = run(script, args.backend)
+			times.append(elapsed)
+
+	mods = importtimes(stderr)
+	total = sum(c for name, depth, s, c in mods if depth == 0)
+	print(f'wall time: median {statistics.median(times)*1000:.1f} ms '
+		f'(min {min(times)*1000:.1f}, {args.repeat} runs)')
+	print(f'imports:   {total/1000:.1f} ms in {len(mods)} modules')
+	for name, depth, self_us, cumulative in sorted(mods, key=lambda m: -m[2])[:args.top]:
+		print(f'  {self_us/1000:7.2f} ms  {name}')
+
+	loaded = sorted({name.split('.')[0] for name, d, s, c in mods} & set(LAZY))
+	if loaded:
+		print(f'modules that should load on demand: {", ".join(loaded)}')
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,175 @@
+# Bytecode en disco (.mcc)
+#
+# Guarda el programa de la maquina de pila ya generado (y optimizado) para
+# ejecutarlo despues sin pasar por lexer, parser ni generador de codigo.
+# `prog` contiene funciones de Python y Symbols, asi que se traduce a un
+# formato portable, todo little-endian:
+#
+#   magic 'MNCC', u16 version
+#   u32 n, n x u32 builtin names    (los operandos de bltin son indices)
+#   u32 n, n x constant             ('d' f64 | 's' str), en orden de slot
+#   u32 n, n x (str name, f64 val)  variables, en orden de slot de data
+#   u32 n, n x i32                  celdas de prog: opcodes y operandos
+#   u32 n, n x (i32 pc, i32 line)   tabla pc -> linea del fuente
+#
+# donde str es u32 longitud + utf-8.
+from errors import CompilerError
+from init import constpool, lookup
+from model import ConstPool, Symbol
+from vm import *
+
+import struct
+import vm
+
+MAGIC   = b'MNCC'
+VERSION = 2
+
+# opcode -> instruction; the position is part of the format
+OPCODES = (
+    STOP, constpush, load, store, jmp, jz, call, ret, funcret, procret,
+    arg, argassign, bltin, add, sub, mul, div, idiv, mod, negate,
+    preinc, predec, postinc, postdec, gt, lt, ge, le, eq, ne,
+    and_, or_, not_, power, addeq, subeq, muleq, diveq, modeq,
+    printtop, prexpr, prstr, varread, pop, xpop,
+    storepop, incvar, decvar, addconst, subconst, mulconst,
+    jnlt, jnle, jngt, jnge, jneq, jnne,
+)
+_opcode = {instr: op for op, instr in enumerate(OPCODES)}
+
+def _str(s):
+    b = s.encode('utf-8')
+    return struct.pack('<I', len(b)) + b
+
+# the program generated in m (default vm.machine), as .mcc bytes
+def dumps(m=None):
+    if m is None:
+        m = vm.machine
+    code = m.prog
+    bltins = []
+    cells = []
+    pc = 0
+    while pc < len(code):
+        instr = code[pc]
+        n = vm._noperands.get(instr, 0)
+        if instr is call or instr not in _opcode:
+            raise CompilerError(f'{getattr(instr, "__name__", instr)} no se puede guardar en bytecode')
+        cells.append(_opcode[instr])
+        for operand in code[pc+1:pc+1+n]:
+            if isinstance(operand, Symbol):     # bltin
+                if operand.name not in bltins:
+                    bltins.append(operand.name)
+                operand = bltins.index(operand.name)
+            cells.append(operand)
+        pc += 1 + n
+
+    out = [MAGIC, struct.pack('<H', VERSION)]
+    out.append(struct.pack('<I', len(bltins)))
+    out.extend(_str(name) for name in bltins)
+    out.append(struct.pack('<I', len(m.consts)))
+    for value in m.consts:
+        if isinstance(value, str):
+            # back to the source text, which loads() interns again
+            out.append(b's' + _str(value.replace('\n', '\\n')))
+        else:
+            out.append(b'd' + struct.pack('<d', value))
+    out.append(struct.pack('<I', len(m.symbols)))
+    for slot, sym in enumerate(m.symbols):
+        out.append(_str(sym.name) + struct.pack('<d', m.data[slot]))
+    out.append(struct.pack('<I', len(cells)))
+    out.append(struct.pack(f'<{len(cells)}i', *cells))
+    lines = list(m.lines)
+    out.append(struct.pack('<I', len(lines)))
+    out.extend(struct.pack('<ii', pc, line) for pc, line in lines)
+    return b''.join(out)
+
+def save(path, m=None):
+    buf = dumps(m)
+    with open(path, 'wb') as f:
+        f.write(buf)
+
+def is_bytecode(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+class _Reader:
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.buf, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def u32(self):
+        return self.unpack('<I')[0]
+
+    def byte(self):
+        b = self.buf[self.pos:self.pos+1]
+        self.pos += 1
+        return b
+
+    def str(self):
+        n = self.u32()
+        s = self.buf[self.pos:self.pos+n].decode('utf-8')
+        self.pos += n
+        return s
+
+# load .mcc bytes into a machine (default vm.machine), ready for execute()
+def loads(buf, m=None, name='<bytecode>'):
+    if m is None:
+        m = vm.machine
+    r = _Reader(buf)
+    if r.buf[:len(MAGIC)] != MAGIC:
+        raise CompilerError(f'{name}: no es un archivo .mcc')
+    r.pos = len(MAGIC)
+    version, = r.unpack('<H')
+    if version != VERSION:
+        raise CompilerError(f'{name}: version de bytecode {version} no soportada')
+
+    bltins = []
+    for _ in range(r.u32()):
+        sym = lookup(r.str())
+        if sym is None or sym.type != 'BLTIN':
+            raise CompilerError(f'{name}: builtin desconocido')
+        bltins.append(sym)
+
+    # the default machine keeps using init.constpool
+    pool = constpool if m is vm.machine else ConstPool()
+    pool.clear()
+    for _ in range(r.u32()):
+        if r.byte() == b's':
+            pool.intern('STRING', r.str())
+        else:
+            pool.intern('NUMBER', r.unpack('<d')[0])
+
+    m.initcode()
+    m.consts = pool.values
+    for _ in range(r.u32()):
+        var = r.str()
+        val, = r.unpack('<d')
+        m.newslot(Symbol(name=var, type='VAR', val=val))
+
+    n = r.u32()
+    cells = r.unpack(f'<{n}i')
+    prog = m.prog
+    pc = 0
+    while pc < n:
+        instr = OPCODES[cells[pc]]
+        k = vm._noperands.get(instr, 0)
+        prog.append(instr)
+        for operand in cells[pc+1:pc+1+k]:
+            prog.append(bltins[operand] if instr is bltin else operand)
+        pc += 1 + k
+
+    for _ in range(r.u32()):
+        m.lines.add(*r.unpack('<ii'))
+    return m
+
+def load_file(path, m=None):
+    with open(path, 'rb') as f:
+        return loads(f.read(), m, path)
@@ -0,0 +1,124 @@
+# Cache de compilacion
+#
+# Guarda el bytecode (.mcc) de cada programa compilado con el backend stack
+# en un directorio local, con nombre = sha256(version del compilador,
+# opciones, fuente). Si el mismo fuente se vuelve a ejecutar sin cambios,
+# run_compiler carga el .mcc y salta lexer, parser y generador de codigo.
+#
+#   MINIC_CACHE_DIR    directorio (default ~/.cache/minic)
+#   MINIC_CACHE_SIZE   tamaño maximo en bytes (default 64 MB)
+#
+# Varios procesos pueden usarlo a la vez: cada entrada se escribe en un
+# archivo temporal y se publica con os.replace, y el LRU usa el mtime de
+# los archivos (se actualiza en cada acierto). Una entrada que desaparece
+# o no se puede leer cuenta como fallo. Los programas que dieron errores o
+# avisos al compilarse no se guardan, para que se vuelvan a mostrar.
+#
+# Tambien guarda, por archivo fuente, el indice de unidades de primer nivel
+# que usa incremental.py para recompilar solo lo que cambio.
+from errors import CompilerError
+from init import constpool
+from vm import initcode
+
+import bytecode
+import hashlib
+import os
+import struct
+import uuid
+
+CACHE_DIR  = os.environ.get('MINIC_CACHE_DIR') or \
+    os.path.join(os.path.expanduser('~'), '.cache', 'minic')
+CACHE_SIZE = int(os.environ.get('MINIC_CACHE_SIZE', 64 * 1024 * 1024))
+
+# modules whose code ends up in the generated program
+_compiler = (
+    'minic.py', 'init.py', 'model.py', 'vm.py', 'irgenerator.py',
+    'optimizer.py', 'peephole.py', 'bytecode.py', 'stream.py',
+    'incremental.py',
+)
+
+_version = None
+
+def compiler_version():
+    global _version
+    if _version is None:
+        h = hashlib.sha256(f'mcc-{bytecode.VERSION}\n'.encode())
+        src = os.path.dirname(os.path.abspath(__file__))
+        for name in _compiler:
+            with open(os.path.join(src, name), 'rb') as f:
+                h.update(f.read())
+        _version = h.hexdigest()
+    return _version
+
+# source: the program text, or its bytes (e.g. an mmap of the file)
+def key(source, *options):
+    h = hashlib.sha256(compiler_version().encode())
+    h.update(repr(options).encode())
+    h.update(source.encode('utf-8') if isinstance(source, str) else source)
+    return h.hexdigest()
+
+def path(key):
+    return os.path.join(CACHE_DIR, key + '.mcc')
+
+# unit index of the source file at source_path (see incremental.py)
+def units_path(source_path, *options):
+    h = hashlib.sha256(compiler_version().encode())
+    h.update(repr(options).encode())
+    h.update(os.path.abspath(source_path).encode('utf-8'))
+    return os.path.join(CACHE_DIR, h.hexdigest() + '.units')
+
+# load the program for key into the VM; False on a miss
+def load(key):
+    try:
+        bytecode.load_file(path(key))
+        os.utime(path(key))
+    except (OSError, CompilerError, ValueError, IndexError, struct.error):
+        # a partial load must not leak into the compilation that follows
+        initcode()
+        constpool.clear()
+        return False
+    return True
+
+# store the program in the VM under key
+def store(key):
+    tmp = os.path.join(CACHE_DIR, f'.{uuid.uuid4().hex}.tmp')
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        bytecode.save(tmp)
+        os.replace(tmp, path(key))
+    except (OSError, CompilerError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    evict()
+
+# remove least recently used entries until the cache fits in CACHE_SIZE
+def evict(limit=None):
+    if limit is None:
+        limit = CACHE_SIZE
+    entries = []
+    total = 0
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                if not entry.name.endswith(('.mcc', '.units')):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+    except OSError:
+        return
+    entries.sort()
+    for _, size, p in entries:
+        if total <= limit:
+            break
+        try:
+            os.remove(p)
+        except OSError:
+            pass        # another process got there first
+        total -= size
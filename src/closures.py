@@ -0,0 +1,264 @@
+# Backend de clausuras (closure-threaded code)
+#
+# En lugar de una lista `prog` recorrida por un bucle de despacho, cada
+# nodo del AST se compila a una funcion de Python sin argumentos que ya
+# tiene capturados sus operandos (otras clausuras, el Symbol de la
+# variable o el valor de la constante). Ejecutar el programa es llamar a
+# la clausura de la raiz.
+from errors import execerror
+from init import constpool
+from irgenerator import has_effects
+from math import fmod
+from model import *
+
+def _div(left, right):
+    def div():
+        a = left()
+        b = right()
+        if b == 0.0:
+            execerror('division por cero')
+        return a / b
+    return div
+
+def _mod(left, right):
+    def mod():
+        a = left()
+        b = right()
+        if b == 0.0:
+            execerror('division por cero')
+        return fmod(a, b)
+    return mod
+
+# value of a binary operator: factory(left, right) -> closure
+_binop = {
+    '+'  : lambda l, r: lambda: l() + r(),
+    '-'  : lambda l, r: lambda: l() - r(),
+    '*'  : lambda l, r: lambda: l() * r(),
+    '/'  : _div,
+    '%'  : _mod,
+    '^'  : lambda l, r: lambda: pow(l(), r()),
+    '<'  : lambda l, r: lambda: 1.0 if l() <  r() else 0.0,
+    '<=' : lambda l, r: lambda: 1.0 if l() <= r() else 0.0,
+    '>'  : lambda l, r: lambda: 1.0 if l() >  r() else 0.0,
+    '>=' : lambda l, r: lambda: 1.0 if l() >= r() else 0.0,
+    '==' : lambda l, r: lambda: 1.0 if l() == r() else 0.0,
+    '!=' : lambda l, r: lambda: 1.0 if l() != r() else 0.0,
+}
+
+# truth value of a condition, no conversion to float
+_test = {
+    '<'  : lambda l, r: lambda: l() <  r(),
+    '<=' : lambda l, r: lambda: l() <= r(),
+    '>'  : lambda l, r: lambda: l() >  r(),
+    '>=' : lambda l, r: lambda: l() >= r(),
+    '==' : lambda l, r: lambda: l() == r(),
+    '!=' : lambda l, r: lambda: l() != r(),
+}
+
+def _assign(sym, expr):
+    def assign():
+        sym.val = expr()
+    return assign
+
+# the right side runs first: a += a++ sees the incremented a
+def _addeq(sym, expr):
+    def addeq():
+        v = expr()
+        sym.val += v
+    return addeq
+
+def _subeq(sym, expr):
+    def subeq():
+        v = expr()
+        sym.val -= v
+    return subeq
+
+def _muleq(sym, expr):
+    def muleq():
+        v = expr()
+        sym.val *= v
+    return muleq
+
+def _diveq(sym, expr):
+    def diveq():
+        v = expr()
+        sym.val /= v
+    return diveq
+
+def _modeq(sym, expr):
+    def modeq():
+        v = expr()
+        sym.val = fmod(sym.val, v)
+    return modeq
+
+_assign_instr = {
+    '='  : _assign,
+    '+=' : _addeq,
+    '-=' : _subeq,
+    '*=' : _muleq,
+    '/=' : _diveq,
+    '%=' : _modeq,
+}
+
+class ClosureGenerator(Visitor):
+    '''
+    Compila el AST a clausuras. Las expresiones devuelven una funcion que
+    calcula su valor y las sentencias una funcion que las ejecuta.
+    '''
+
+    def __init__(self):
+        self.assigned = set()   # names written somewhere in the program
+        self.used = {}          # name -> Symbol of variables read
+
+    @classmethod
+    def generate(cls, model):
+        generator = cls()
+        return model.accept(generator)
+
+    # closure for the truth value of a while/if condition
+    def test(self, node):
+        if isinstance(node, Binop):
+            if node.op in _test:
+                return _test[node.op](self.visit(node.left), self.visit(node.right))
+            if not has_effects(node.right):
+                left, right = self.test(node.left), self.test(node.right)
+                if node.op == '&&':
+                    return lambda: left() and right()
+                if node.op == '||':
+                    return lambda: left() or right()
+        if isinstance(node, Unaryop) and node.op == '!':
+            expr = self.test(node.expr)
+            return lambda: not expr()
+        return self.visit(node)
+
+    def visit(self, node: Program):
+        body = self.visit(node.stmts)
+        for name, sym in self.used.items():
+            if name not in self.assigned and sym.type == 'UNDEF':
+                execerror(f"variable no definida '{name}'")
+        return body
+
+    def visit(self, node: list):
+        stmts = tuple(self.visit(stmt) for stmt in node)
+        if len(stmts) == 1:
+            return stmts[0]
+        def block():
+            for stmt in stmts:
+                stmt()
+        return block
+
+    def visit(self, node: Assignment):
+        sym = node.var.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            execerror(f'asignacion a no variable {sym.name}')
+        self.assigned.add(sym.name)
+        return _assign_instr[node.op](sym, self.visit(node.expr))
+
+    def visit(self, node: Print):
+        items = []
+        for expr in node.exprs:
+            if isinstance(expr, String):
+                s = constpool.values[expr.sym.slot]
+                items.append(lambda s=s: print(s, end=''))
+            else:
+                e = self.visit(expr)
+                items.append(lambda e=e: print('%.12g ' % e(), end=''))
+        items = tuple(items)
+        def printf():
+            for item in items:
+                item()
+        return printf
+
+    def visit(self, node: While):
+        cond = self.test(node.cond)
+        body = self.visit(node.body)
+        def whilecode():
+            while cond():
+                body()
+        return whilecode
+
+    def visit(self, node: If):
+        cond = self.test(node.cond)
+        then = self.visit(node.stmt)
+        if not node.stmt1:
+            def ifcode():
+                if cond():
+                    then()
+            return ifcode
+        else_ = self.visit(node.stmt1)
+        def ifelse():
+            if cond():
+                then()
+            else:
+                else_()
+        return ifelse
+
+    def visit(self, node: Literal):
+        val = node.sym.val
+        return lambda: val
+
+    def visit(self, node: Variable):
+        sym = node.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            execerror(f"intento de evaluar una no variable '{sym.name}'")
+        self.used[sym.name] = sym
+        return lambda: sym.val
+
+    def visit(self, node: Bltin):
+        func = node.sym.ptr
+        expr = self.visit(node.expr)
+        return lambda: func(expr())
+
+    def visit(self, node: Binop):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if node.op == '&&':
+            if has_effects(node.right):
+                return lambda: 1.0 if (left() != 0.0) & (right() != 0.0) else 0.0
+            return lambda: 1.0 if left() != 0.0 and right() != 0.0 else 0.0
+        if node.op == '||':
+            if has_effects(node.right):
+                return lambda: 1.0 if (left() != 0.0) | (right() != 0.0) else 0.0
+            return lambda: 1.0 if left() != 0.0 or right() != 0.0 else 0.0
+        return _binop[node.op](left, right)
+
+    def visit(self, node: Unaryop):
+        expr = self.visit(node.expr)
+        if node.op == '-':
+            return lambda: -expr()
+        return lambda: 1.0 if expr() == 0.0 else 0.0
+
+    def visit(self, node: Preinc):
+        sym = self.incvar(node.sym)
+        def preinc():
+            sym.val += 1.0
+            return sym.val
+        return preinc
+
+    def visit(self, node: Predec):
+        sym = self.incvar(node.sym)
+        def predec():
+            sym.val -= 1.0
+            return sym.val
+        return predec
+
+    def visit(self, node: Postinc):
+        sym = self.incvar(node.sym)
+        def postinc():
+            v = sym.val
+            sym.val = v + 1.0
+            return v
+        return postinc
+
+    def visit(self, node: Postdec):
+        sym = self.incvar(node.sym)
+        def postdec():
+            v = sym.val
+            sym.val = v - 1.0
+            return v
+        return postdec
+
+    def incvar(self, sym):
+        self.used[sym.name] = sym
+        self.assigned.add(sym.name)
+        return sym
@@ -10,29 +10,40 @@
 
 # Podría expandir esto para que sea más poderoso más adelante
 
-# Variable global que indica si se ha producido algún error. El compilador
-# puede ver esto más tarde para decidir si morir o no.
+# Cuenta de errores producidos. El compilador puede ver esto más tarde
+# para decidir si morir o no. Es una ContextVar para que cada hilo o tarea
+# de asyncio que ejecuta un Interpreter lleve su propia cuenta.
+from contextvars import ContextVar
 
-_errors_detected = 0
+_errors_detected = ContextVar('errors_detected', default=0)
+
+# Donde se escriben los mensajes; None es sys.stdout. Un Interpreter pone
+# aqui su `out` mientras compila o ejecuta.
+_output = ContextVar('output', default=None)
 
 class CompilerError(Exception):
 	pass
 
 def warning(message, lineno=None):
-	global _errors_detected
 	if lineno:
-		print(f'{lineno}: {message}')
+		print(f'{lineno}: {message}', file=_output.get())
 	else:
-		print(message)
-	_errors_detected += 1
+		print(message, file=_output.get())
+	_errors_detected.set(_errors_detected.get() + 1)
 
 def execerror(message, lineno=None):
 	warning(message, lineno)
 	#exit(1)
 
 def errors_detected():
-	return _errors_detected
+	return _errors_detected.get()
+	
+# escribir los mensajes en `out` hasta reset_output(token)
+def set_output(out):
+	return _output.set(out)
+	
+def reset_output(token):
+	_output.reset(token)
 	
 def clear_errors():
-	global _errors_detected
-	_errors_detected = 0
+	_errors_detected.set(0)
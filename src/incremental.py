@@ -0,0 +1,442 @@
+# Recompilacion incremental
+#
+# Cada sentencia o definicion de primer nivel que reduce Parser.list es una
+# unidad: el tramo del fuente desde su primer token hasta el primero de la
+# siguiente, con su huella (blake2b de esos bytes) y el codigo que genero,
+# guardado con operandos independientes de la compilacion (nombres de
+# variables y de builtins, valores de constantes, saltos relativos a la
+# unidad). El indice de unidades de cada archivo queda en el cache, en
+# JSON, con la version del formato y el hash del compilador: si no
+# coinciden, o algun campo no es valido, se descarta y se compila todo.
+#
+# Al recompilar, las unidades iguales al principio y al final del archivo
+# se reubican en prog sin pasar por lexer, parser ni generador; solo el
+# tramo del medio se vuelve a compilar, y se deja de parsear en cuanto una
+# sentencia termina donde empieza una unidad del final que no cambio.
+#
+# Una unidad del principio se reutiliza solo si el primer token que la
+# sigue es del mismo tipo que antes (el parser es LALR(1): con ese token
+# decide que la sentencia termino) y su ultimo byte no puede continuar un
+# token en el texto nuevo (no es letra, digito ni punto). Ademas tiene que
+# repetirse el plegado de constantes: las constantes de init.consts
+# asignadas antes de la unidad.
+from bisect import bisect_left
+from errors import errors_detected
+from init import constpool, consts, lookup, symlist
+from irgenerator import CodeGenerator
+from model import Symbol
+from optimizer import ConstantFolder, assigned_names
+from vm import _const_instr, _jump_instr, _noperands, _slot_instr, bltin, call
+
+import bytecode
+import cache
+import contextlib
+import contextvars
+import hashlib
+import io
+import json
+import os
+import peephole
+import stream
+import uuid
+import vm
+
+VERSION = 2     # format of the saved unit index
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+class Unit:
+    '''
+    Una sentencia de primer nivel ya compilada. `cells` es None si no se
+    puede reutilizar (dio errores o avisos al compilarse, o usa call).
+    '''
+    __slots__ = (
+        'size',         # bytes of source
+        'digest',       # digest() of those bytes
+        'newlines',     # newlines in them
+        'follow',       # type of the token after the unit ('$end' at the end)
+        'safe',         # the last byte cannot run into the text that follows
+        'context',      # const names assigned before the unit
+        'assigned',     # names assigned in the unit, for the constant folder
+        'used',         # variables read, for CodeGenerator.finish
+        'stored',       # variables written by the generated code
+        'cells',        # code: instruction names and portable operands
+        'lines',        # (pc, line) relative to the unit
+    )
+
+    def __init__(self, **fields):
+        self.__setstate__(fields)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name in self.__slots__:
+            setattr(self, name, state[name])
+
+class _Resync(Exception):
+    def __init__(self, j):
+        self.j = j
+
+class _Tokens:
+    '''
+    Tokens de buf desde el byte start, como stream.tokenize, recordando
+    el ultimo entregado (None al terminar) y el byte y la linea donde
+    empieza (len(buf) y la ultima linea al terminar).
+    '''
+
+    def __init__(self, lexer, buf, start, lineno):
+        self.lexer = lexer
+        self.buf = buf
+        self.start = start
+        self.token = None
+        self.offset = start
+        self.lineno = lineno
+
+    def __iter__(self):
+        buf, lexer = self.buf, self.lexer
+        lineno = self.lineno
+        for start, end in stream.spans(buf, stream.CHUNK, self.start):
+            text = buf[start:end].decode('utf-8')
+            isascii = text.isascii()
+            index, offset = 0, start
+            for tok in lexer.tokenize(text, lineno):
+                if isascii:
+                    offset = start + tok.index
+                else:
+                    offset += len(text[index:tok.index].encode('utf-8'))
+                    index = tok.index
+                self.token, self.offset, self.lineno = tok, offset, tok.lineno
+                yield tok
+            lineno = lexer.lineno
+        self.token, self.offset, self.lineno = None, len(buf), lineno
+
+def _type(tok):
+    return '$end' if tok is None else tok.type
+
+class Compilation:
+    '''
+    Genera en la maquina m (por omision la global) el programa del fuente
+    buf, reutilizando las unidades de `old` (las de la compilacion
+    anterior del mismo archivo) que no cambiaron.
+    '''
+
+    def __init__(self, buf, old=(), optimize=True, m=None, symtab=None, pool=None):
+        self.buf = buf
+        self.old = list(old)
+        self.generator = CodeGenerator(m)
+        self.folder = ConstantFolder(set(), pool) if optimize else None
+        self.symtab = symlist if symtab is None else symtab
+        self.pool = constpool if pool is None else pool
+        self.units = []         # units of buf, in order
+        self.reused = 0
+        self.aligned = {}       # offset in buf -> index in old of an unchanged unit there
+        self.start = 0          # offset and line where the next unit starts
+        self.line = 1
+
+    def compile(self):
+        buf, old = self.buf, self.old
+        self.generator.m.initcode()
+
+        # unchanged units at the start, as long as the last one still ends there
+        k = pos = 0
+        while k < len(old) and old[k].cells is not None and self.matches(old[k], pos):
+            pos += old[k].size
+            k += 1
+        while k and not (old[k-1].safe and old[k-1].follow == self.peek(pos)):
+            k -= 1
+            pos -= old[k].size
+        for unit in old[:k]:
+            self.link(unit)
+
+        # unchanged units at the end
+        end = len(buf)
+        for j in reversed(range(k, len(old))):
+            start = end - old[j].size
+            if start < pos or not self.matches(old[j], start):
+                break
+            self.aligned[start] = j
+            end = start
+
+        # the rest, stopping wherever an unchanged unit can be reused
+        while True:
+            j = self.parse(self.tokens(self.start, self.line))
+            if j is None:
+                break
+            while j < len(old) and self.reusable(old[j]):
+                self.link(old[j])
+                j += 1
+            if j == len(old):
+                break
+
+        self.generator.finish()
+        return self
+
+    def matches(self, unit, pos):
+        end = pos + unit.size
+        return end <= len(self.buf) and digest(self.buf[pos:end]) == unit.digest
+
+    # const names assigned so far, which decide how a unit is folded
+    def context(self):
+        if self.folder is None:
+            return ()
+        return tuple(sorted(self.folder.assigned & consts.keys()))
+
+    def reusable(self, unit):
+        return unit.cells is not None and unit.context == self.context()
+
+    def symbol(self, name):
+        sym = self.symtab.lookup(name)
+        if sym is None:
+            sym = Symbol(name=name, type='UNDEF')
+            self.symtab.add(sym)
+        elif sym.type == 'VAR':
+            sym = self.symtab.own(sym)
+        return sym
+
+    def tokens(self, pos, line):
+        from minic import Lexer
+        return _Tokens(Lexer(self.symtab, self.pool), self.buf, pos, line)
+
+    # type of the first token from pos on; illegal characters before it
+    # are reported (and counted) when the parser gets there
+    def peek(self, pos):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return contextvars.copy_context().run(
+                lambda: _type(next(iter(self.tokens(pos, 1)), None)))
+
+    # parse from tokens.start; the index in old of the unit it stopped at, or None at the end
+    def parse(self, tokens):
+        from minic import Parser
+
+        lexed = 0
+
+        def emit(stmt):
+            nonlocal lexed
+            # the parser already read the token that follows stmt, so
+            # illegal characters up to it have been reported
+            clean = tokens.lexer.errors == lexed
+            lexed = tokens.lexer.errors
+            self.units.append(self.generate(stmt, tokens.offset, _type(tokens.token), clean))
+            self.start, self.line = tokens.offset, tokens.lineno
+            j = self.aligned.get(self.start)
+            if j is not None and self.reusable(self.old[j]):
+                raise _Resync(j)
+
+        try:
+            Parser(emit).parse(iter(tokens))
+        except _Resync as e:
+            return e.j
+        return None
+
+    def generate(self, stmt, end, follow, clean=True):
+        g = self.generator
+        pc = len(g.prog)
+        before = errors_detected()
+        context = self.context()
+        assigned = set()
+        used, stored = g.used, g.assigned
+        g.used, g.assigned = {}, set()
+        if self.folder is None:
+            g.statement(stmt)
+        else:
+            assigned_names(stmt, assigned)
+            self.folder.assigned |= assigned
+            for stmt in self.folder.visit([stmt]):
+                g.statement(stmt)
+            peephole.optimize(g.prog, g.m.lines, pc)
+        unit_used, unit_stored = g.used, g.assigned
+        used.update(unit_used)
+        stored |= unit_stored
+        g.used, g.assigned = used, stored
+
+        text = self.buf[self.start:end]
+        last = chr(text[-1]) if text else ' '
+        return Unit(
+            size=len(text),
+            digest=digest(text),
+            newlines=text.count(b'\n'),
+            follow=follow,
+            safe=not (last.isalnum() or last in '_.'),
+            context=context,
+            assigned=tuple(sorted(assigned)),
+            used=tuple(unit_used),
+            stored=tuple(sorted(unit_stored)),
+            cells=self.cells(pc) if clean and errors_detected() == before else None,
+            lines=self.lines(pc),
+        )
+
+    # code from pc on with operands that do not depend on this compilation
+    def cells(self, pc):
+        m = self.generator.m
+        prog = m.prog
+        start = pc
+        cells = []
+        while pc < len(prog):
+            instr = prog[pc]
+            n = _noperands.get(instr, 0)
+            if instr is call:
+                return None
+            cells.append(instr.__name__)
+            for operand in prog[pc+1:pc+1+n]:
+                if instr in _slot_instr:
+                    operand = m.symbols[operand].name
+                elif instr in _const_instr:
+                    c = self.pool[operand]
+                    operand = (c.type, c.str if c.type == 'STRING' else c.val)
+                elif instr in _jump_instr:
+                    operand -= start
+                elif instr is bltin:
+                    operand = operand.name
+                cells.append(operand)
+            pc += 1 + n
+        return cells
+
+    # line table entries from pc on, relative to the unit
+    def lines(self, pc):
+        table = self.generator.m.lines
+        if pc == len(self.generator.prog):
+            return []
+        i = bisect_left(table.pcs, pc)
+        lines = [(p - pc, line - self.line) for p, line in zip(table.pcs[i:], table.lines[i:])]
+        first = table.lookup(pc)
+        if first and (not lines or lines[0][0] != 0):
+            lines.insert(0, (0, first - self.line))
+        return lines
+
+    # relocate the code of an unchanged unit to the end of prog
+    def link(self, unit):
+        g = self.generator
+        base = len(g.prog)
+        cells = unit.cells
+        i = 0
+        while i < len(cells):
+            instr = getattr(vm, cells[i])
+            n = _noperands.get(instr, 0)
+            g.code(instr)
+            for operand in cells[i+1:i+1+n]:
+                if instr in _slot_instr:
+                    operand = g.slot(self.symbol(operand))
+                elif instr in _const_instr:
+                    operand = self.pool.intern(*operand).slot
+                elif instr in _jump_instr:
+                    operand += base
+                elif instr is bltin:
+                    operand = self.symtab.lookup(operand)
+                g.code(operand)
+            i += 1 + n
+        for pc, line in unit.lines:
+            g.m.lines.add(base + pc, self.line + line)
+
+        for name in unit.used:
+            g.used[name] = self.symbol(name)
+        g.assigned.update(unit.stored)
+        if self.folder is not None:
+            self.folder.assigned.update(unit.assigned)
+        self.units.append(unit)
+        self.reused += 1
+        self.start += unit.size
+        self.line += unit.newlines
+
+# name -> instruction for the instructions a unit may contain
+_instrs = {instr.__name__: instr for instr in bytecode.OPCODES
+           if instr is not None and instr is not call}
+
+def _operand(instr, operand, ncells):
+    if instr in _slot_instr:
+        ok = isinstance(operand, str)
+    elif instr in _const_instr:
+        ok = (isinstance(operand, list) and len(operand) == 2 and
+              (operand[0] == 'STRING' and isinstance(operand[1], str) or
+               operand[0] == 'NUMBER' and type(operand[1]) in (int, float)))
+    elif instr in _jump_instr:
+        ok = type(operand) is int and 0 <= operand <= ncells
+    elif instr is bltin:
+        sym = lookup(operand) if isinstance(operand, str) else None
+        ok = sym is not None and sym.type == 'BLTIN'
+    else:
+        ok = False
+    if not ok:
+        raise ValueError(f'operando invalido de {instr.__name__}: {operand!r}')
+    return tuple(operand) if instr in _const_instr else operand
+
+def _cells(cells):
+    checked = []
+    i = 0
+    while i < len(cells):
+        instr = _instrs[cells[i]]
+        n = _noperands.get(instr, 0)
+        if i + 1 + n > len(cells):
+            raise ValueError(f'faltan operandos de {instr.__name__}')
+        checked.append(cells[i])
+        for operand in cells[i+1:i+1+n]:
+            checked.append(_operand(instr, operand, len(cells)))
+        i += 1 + n
+    return checked
+
+def _names(names):
+    if not all(isinstance(name, str) for name in names):
+        raise ValueError('nombre invalido')
+    return tuple(names)
+
+# a Unit from its fields in the index, checking every one of them
+def _unit(fields):
+    unit = Unit(**fields)
+    if not (type(unit.size) is int and unit.size >= 0 and
+            type(unit.newlines) is int and unit.newlines >= 0 and
+            isinstance(unit.follow, str) and isinstance(unit.safe, bool)):
+        raise ValueError('unidad invalida')
+    unit.digest = bytes.fromhex(unit.digest)
+    for name in ('context', 'assigned', 'used', 'stored'):
+        setattr(unit, name, _names(getattr(unit, name)))
+    if unit.cells is not None:
+        unit.cells = _cells(unit.cells)
+    unit.lines = [(pc, line) for pc, line in unit.lines]
+    if not all(type(pc) is int and type(line) is int for pc, line in unit.lines):
+        raise ValueError('linea invalida')
+    return unit
+
+def load_index(path):
+    '''
+    Unidades guardadas en path, o [] si no hay indice o no es de esta
+    version del formato y del compilador (se recompila todo).
+    '''
+    try:
+        with open(path, 'rb') as f:
+            data = json.load(f)
+        if data['version'] != VERSION or data['compiler'] != cache.compiler_version():
+            return []
+        return [_unit(fields) for fields in data['units']]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return []
+
+def save_index(path, units):
+    data = {
+        'version': VERSION,
+        'compiler': cache.compiler_version(),
+        'units': [dict(unit.__getstate__(), digest=unit.digest.hex()) for unit in units],
+    }
+    tmp = os.path.join(os.path.dirname(path), f'.{uuid.uuid4().hex}.tmp')
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    cache.evict()
+
+def compile(buf, path, optimize=True):
+    '''
+    Compila buf, el fuente del archivo path, a partir de las unidades de
+    su compilacion anterior, y guarda las nuevas para la siguiente.
+    '''
+    index = cache.units_path(path, optimize)
+    c = Compilation(buf, load_index(index), optimize).compile()
+    save_index(index, c.units)
+    return c
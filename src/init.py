@@ -39,27 +39,32 @@ builtins = {
 }
 
 # Inicialización Tabla de Simbolos
-symlist = LinkedList()
+# Palabras clave, constantes y builtins van en `predefined`, compartida
+# (solo lectura) por symlist y por las tablas de cada Interpreter
+predefined = SymbolTable()
+symlist = SymbolTable(predefined)
+
+# Constantes literales (NUMBER, STRING): no entran en symlist
+constpool = ConstPool()
 
 def lookup(s):
-	for sp in symlist:
-		if sp.name == s:
-			return sp
-	return None
+	return symlist.lookup(s)
 	
 def install(s,t,d=0.0):
 	sp = Symbol(name=s,type=t,val=d)
 	symlist.add(sp)
 	return sp
 	
-def init():
+def constant(t,d=0.0):
+	return constpool.intern(t, d)
+	
+def init(table=predefined):
 	for name, kval in keywords.items():
-		install(name, kval)
+		table.add(Symbol(name=name, type=kval))
 	for name, cval in consts.items():
-		install(name, 'VAR', cval)
+		table.add(Symbol(name=name, type='VAR', val=cval))
 	for name, func in builtins.items():
-		s = install(name, 'BLTIN')
-		s.ptr = func
+		table.add(Symbol(name=name, type='BLTIN', ptr=func))
 
 # inicialización tabla de simbolos
 init()
@@ -0,0 +1,75 @@
+# Interpretes independientes
+#
+# Un Interpreter compila y ejecuta un programa sin tocar el estado global
+# de los modulos: tiene su propia tabla de simbolos (sobre init.predefined,
+# que comparten todos y no se modifica), su pool de constantes y su
+# Machine, y lo que imprime (mensajes de error incluidos) va a su propio
+# `out`. Varios interpretes pueden usarse a la vez desde distintos hilos,
+# y run_async() cede el control al event loop cada SLICE instrucciones
+# para que un programa largo no bloquee a los demas.
+from errors import errors_detected, reset_output, set_output
+from init import predefined
+from irgenerator import CodeGenerator
+from model import ConstPool, SymbolTable
+from optimizer import ConstantFolder
+from vm import Machine
+
+import asyncio
+import peephole
+
+SLICE = 10000   # instructions between yields in run_async
+
+class Interpreter:
+
+    def __init__(self, out=None):
+        self.symtab  = SymbolTable(predefined)
+        self.pool    = ConstPool()
+        self.machine = Machine(consts=self.pool.values, out=out)
+        self.errors  = 0        # errors reported while compiling or running
+
+    @classmethod
+    def from_source(cls, source, out=None, optimize=True):
+        return cls(out).compile(source, optimize)
+
+    def compile(self, source, optimize=True):
+        from minic import Lexer, Parser
+        before = errors_detected()
+        token = set_output(self.machine.out)
+        try:
+            top = Parser().parse(Lexer(self.symtab, self.pool).tokenize(source))
+            if optimize:
+                top = ConstantFolder.optimize(top, self.pool)
+            self.machine.initcode()
+            CodeGenerator.generate(top, self.machine)
+            if optimize:
+                peephole.optimize(self.machine.prog, self.machine.lines)
+        finally:
+            reset_output(token)
+            self.errors += errors_detected() - before
+        return self
+
+    # global variable values after a run
+    def variables(self):
+        m = self.machine
+        return {sym.name: m.data[slot] for slot, sym in enumerate(m.symbols)}
+
+    def run(self):
+        before = errors_detected()
+        token = set_output(self.machine.out)
+        try:
+            self.machine.execute()
+        finally:
+            reset_output(token)
+            self.errors += errors_detected() - before
+
+    async def run_async(self, slice=SLICE):
+        m = self.machine
+        m.pc = 0
+        before = errors_detected()
+        token = set_output(m.out)
+        try:
+            while m.step(slice):
+                await asyncio.sleep(0)
+        finally:
+            reset_output(token)
+            self.errors += errors_detected() - before
@@ -1,15 +1,18 @@
+from errors import execerror
 from model import *
 from vm import *
 
+import regvm
+
 class CodeGenerator(Visitor):
 
     _assign_instr = {
-        '='  : assign,
+        '='  : store,
         '+=' : addeq,
         '-=' : subeq,
         '*=' : muleq,
         '/=' : diveq,
-        '%/' : modeq,
+        '%=' : modeq,
     }
     _binop_instr = {
         '+'  : add,
@@ -32,29 +35,85 @@ class CodeGenerator(Visitor):
         '!' : not_,
     }
 
+    def __init__(self, m=None):
+        self.m = machine if m is None else m
+        self.prog = self.m.prog
+        self.slots = {}         # name -> data slot
+        self.assigned = set()   # names written somewhere in the program
+        self.used = {}          # name -> Symbol of variables read
+
     @classmethod
-    def generate(cls, model):
-        generator = cls()
+    def generate(cls, model, m=None):
+        generator = cls(m)
         model.accept(generator)
 
+    def code(self, f):
+        return code(f, self.m)
+
+    def code2(self, c1, c2):
+        return code2(c1, c2, self.m)
+
+    # code emitted from here on comes from source line lineno
+    def mark(self, lineno):
+        if lineno:
+            self.m.lines.add(len(self.prog), lineno)
+
+    # statement list for a body that may be a single statement
+    def block(self, stmts):
+        return self.visit(stmts if isinstance(stmts, list) else [stmts])
+
+    # data slot of a variable, resolved once per compilation
+    def slot(self, sym):
+        slot = self.slots.get(sym.name)
+        if slot is None:
+            slot = self.slots[sym.name] = self.m.newslot(sym)
+        return slot
+
     def visit(self, node: Program):
         '''
         program : list
         code(STOP)
         '''
-        for stmt in node.stmts:
+        self.visit(node.stmts)
+        self.finish()
+
+    # one more top-level statement, generated as soon as it is parsed
+    def statement(self, stmt):
+        self.visit([stmt])
+
+    # end of the program: STOP and the check for variables never assigned
+    def finish(self):
+        self.code(STOP)
+        for name, sym in self.used.items():
+            if name not in self.assigned and sym.type == 'UNDEF':
+                execerror(f"variable no definida '{name}'")
+
+    def visit(self, node: list):
+        '''
+        stmtlist : stmtlist stmt
+        stmt : expr  ->  code(xpop)
+        '''
+        pc = len(self.prog)
+        for stmt in node:
+            self.mark(getattr(stmt, 'lineno', 0))
             self.visit(stmt)
-        code(STOP)
+            if isinstance(stmt, Expression):
+                self.code(xpop)
+        return pc
         
     def visit(self, node: Assignment):
         '''
         asg : VAR '=' expr
-        code3(varpush, p.VAR, assign)
+        code2(store, slot)
         return p.expr
         '''
+        sym = node.var.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            execerror(f'asignacion a no variable {sym.name}')
+        self.assigned.add(sym.name)
         pc = self.visit(node.expr)
-        code3(varpush, node.var.sym, self._assign_instr[node.op])
-        code(pop)
+        self.code2(self._assign_instr[node.op], self.slot(sym))
+        self.code(pop)
         return pc
         
     def visit(self, node: Print):
@@ -65,44 +124,50 @@ class CodeGenerator(Visitor):
         pc = 0
         for expr in node.exprs:
             if isinstance(expr, String):
-                ret = code2(prstr, expr.sym.str)
+                ret = self.code2(prstr, expr.sym.slot)
             else:
                 ret = self.visit(expr)
-                code(prexpr)
+                self.code(prexpr)
             if pc == 0: pc = ret
         return pc
 
     def visit(self, node: While):
-        pc = code3(whilecode, STOP, STOP)
-        self.visit(node.cond)
-        code(STOP)
-        pstmt = 0
-        for stmt in node.body:
-            ret = self.visit(stmt)
-            if pstmt == 0: pstmt = ret
-        pend = code(STOP) + 1
-        prog[pc+1] = pstmt
-        prog[pc+2] = pend
+        '''
+        top: cond
+             jz   end
+             body
+             jmp  top
+        end:
+        '''
+        pc = self.visit(node.cond)
+        pjz = self.code2(jz, STOP)
+        self.block(node.body)
+        self.mark(node.lineno)
+        self.code2(jmp, pc)
+        self.prog[pjz+1] = len(self.prog)
         return pc
 
     def visit(self, node: If):
-        pc = code(ifcode)
-        code3(STOP, STOP, STOP)
-        self.visit(node.cond)
-        code(STOP)
-        pthen = STOP
-        for s in node.stmt:
-            ret = self.visit(s)
-            if pthen is STOP: pthen = ret
-        code(STOP)
-        pelse = STOP
-        for s in node.stmt1:
-            ret = self.visit(s)
-            if pelse is STOP: pelse = ret
-        pend = code(STOP) + 1
-        prog[pc+1] = pthen
-        prog[pc+2] = pelse
-        prog[pc+3] = pend
+        '''
+             cond
+             jz   else
+             then
+             jmp  end        (only with else part)
+        else:
+             else part
+        end:
+        '''
+        pc = self.visit(node.cond)
+        pjz = self.code2(jz, STOP)
+        self.block(node.stmt)
+        if node.stmt1:
+            self.mark(node.lineno)
+            pjmp = self.code2(jmp, STOP)
+            self.prog[pjz+1] = len(self.prog)
+            self.block(node.stmt1)
+            self.prog[pjmp+1] = len(self.prog)
+        else:
+            self.prog[pjz+1] = len(self.prog)
         return pc
 
     def visit(self, node: Literal):
@@ -110,16 +175,18 @@ class CodeGenerator(Visitor):
         expr : NUMBER
         code2(constpush, p.NUMBER)
         '''
-        return code2(constpush, node.sym)
+        return self.code2(constpush, node.sym.slot)
 
     def visit(self, node: Variable):
-        print('var',node.sym)
         '''
         expr : VAR
-        code3(varpush, p.VAR, eval)
+        code2(load, slot)
         '''
-        verify(node.sym)
-        return code3(varpush, node.sym, eval)
+        sym = node.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            execerror(f"intento de evaluar una no variable '{sym.name}'")
+        self.used[sym.name] = sym
+        return self.code2(load, self.slot(sym))
 
     def visit(self, node: Bltin):
         '''
@@ -128,7 +195,7 @@ class CodeGenerator(Visitor):
         return p.expr
         '''
         pc = self.visit(node.expr)
-        code2(bltin, node.sym)
+        self.code2(bltin, node.sym)
         return pc
 
     def visit(self, node: Binop):
@@ -138,7 +205,7 @@ class CodeGenerator(Visitor):
         '''
         pc = self.visit(node.left)
         self.visit(node.right)
-        code(self._binop_instr[node.op])
+        self.code(self._binop_instr[node.op])
         return pc
 
     def visit(self, node: Unaryop):
@@ -147,23 +214,252 @@ class CodeGenerator(Visitor):
         code(add)
         '''
         pc = self.visit(node.expr)
-        code(self._unaryop_instr[node.op])
+        self.code(self._unaryop_instr[node.op])
         return pc
 
     def visit(self, node: Preinc):
-        return code2(preinc, node.sym)
+        return self.code2(preinc, self.incvar(node.sym))
+
+    def visit(self, node: Predec):
+        return self.code2(predec, self.incvar(node.sym))
+
+    def visit(self, node: Postinc):
+        return self.code2(postinc, self.incvar(node.sym))
+
+    def visit(self, node: Postdec):
+        return self.code2(postdec, self.incvar(node.sym))
+
+    def incvar(self, sym):
+        self.used[sym.name] = sym
+        self.assigned.add(sym.name)
+        return self.slot(sym)
+
+
+# True if evaluating the expression changes a variable (++ or --)
+def has_effects(node):
+    if isinstance(node, (Preinc, Predec, Postinc, Postdec)):
+        return True
+    if isinstance(node, Binop):
+        return has_effects(node.left) or has_effects(node.right)
+    if isinstance(node, (Unaryop, Bltin)):
+        return has_effects(node.expr)
+    return False
+
+class RegisterGenerator(Visitor):
+    '''
+    Genera codigo de tres direcciones para regvm a partir del mismo AST.
+    Las expresiones devuelven el registro que contiene su valor: una
+    variable o una constante no emiten ninguna instruccion.
+    '''
+    _binop_instr = {
+        '+'  : regvm.add,
+        '-'  : regvm.sub,
+        '*'  : regvm.mul,
+        '/'  : regvm.div,
+        '%'  : regvm.mod,
+        '^'  : regvm.power,
+        '<'  : regvm.lt,
+        '<=' : regvm.le,
+        '>'  : regvm.gt,
+        '>=' : regvm.ge,
+        '==' : regvm.eq,
+        '!=' : regvm.ne,
+        '&&' : regvm.and_,
+        '||' : regvm.or_,
+    }
+    _assign_instr = {
+        '+=' : regvm.add,
+        '-=' : regvm.sub,
+        '*=' : regvm.mul,
+        '/=' : regvm.div,
+        '%=' : regvm.mod,
+    }
+    _unaryop_instr = {
+        '-' : regvm.negate,
+        '!' : regvm.not_,
+    }
+    # jump unless the comparison holds
+    _branch_instr = {
+        '<'  : regvm.jnlt,
+        '<=' : regvm.jnle,
+        '>'  : regvm.jngt,
+        '>=' : regvm.jnge,
+        '==' : regvm.jneq,
+        '!=' : regvm.jnne,
+    }
+
+    def __init__(self):
+        self.rc = regvm.RegCode()
+        self.vars = {}          # name -> register
+        self.consts = {}        # value -> register
+        self.free = []          # released temporaries
+        self.temps = []         # temporaries of the current statement
+        self.assigned = set()   # names written somewhere in the program
+        self.used = {}          # name -> Symbol of variables read
+
+    @classmethod
+    def generate(cls, model):
+        generator = cls()
+        model.accept(generator)
+        return generator.rc
+
+    def emit(self, op, a=None, b=None, c=None):
+        self.rc.code.append((op, a, b, c))
+        return len(self.rc.code) - 1
+
+    def newreg(self, val=None):
+        self.rc.regs.append(val)
+        return len(self.rc.regs) - 1
+
+    def temp(self):
+        reg = self.free.pop() if self.free else self.newreg()
+        self.temps.append(reg)
+        return reg
+
+    def var(self, sym):
+        reg = self.vars.get(sym.name)
+        if reg is None:
+            reg = self.vars[sym.name] = self.newreg()
+            self.rc.syms.append((reg, sym))
+        return reg
+
+    def const(self, val):
+        reg = self.consts.get(val)
+        if reg is None:
+            reg = self.consts[val] = self.newreg(val)
+        return reg
+
+    def patch(self, at, target):
+        op, *operands = self.rc.code[at]
+        operands[regvm._targets[op]] = target
+        self.rc.code[at] = (op, *operands)
+
+    # emit a jump to be patched that is taken when cond is false
+    def branch(self, cond):
+        if isinstance(cond, Binop) and cond.op in self._branch_instr:
+            left, right = self.operands(cond)
+            at = self.emit(self._branch_instr[cond.op], left, right)
+        else:
+            at = self.emit(regvm.jz, self.visit(cond))
+        self.release()
+        return at
+
+    # evaluate both sides of a binop; if the right side has ++/-- the
+    # left value is copied first so it is not seen already modified
+    def operands(self, node):
+        left = self.visit(node.left)
+        if left not in self.temps and has_effects(node.right):
+            tmp = self.temp()
+            self.emit(regvm.move, tmp, left)
+            left = tmp
+        return left, self.visit(node.right)
+
+    def release(self):
+        self.free.extend(self.temps)
+        self.temps.clear()
+
+    def visit(self, node: Program):
+        self.visit(node.stmts)
+        for name, sym in self.used.items():
+            if name not in self.assigned and sym.type == 'UNDEF':
+                execerror(f"variable no definida '{name}'")
+
+    def visit(self, node: list):
+        for stmt in node:
+            self.visit(stmt)
+            self.release()
+
+    def visit(self, node: Assignment):
+        sym = node.var.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            execerror(f'asignacion a no variable {sym.name}')
+        dst = self.var(sym)
+        self.assigned.add(sym.name)
+        src = self.visit(node.expr)
+        if node.op != '=':
+            self.emit(self._assign_instr[node.op], dst, dst, src)
+        elif src in self.temps and self.rc.code[-1][1] == src \
+                and self.rc.code[-1][0] not in (regvm.postinc, regvm.postdec):
+            # retarget the instruction that produced the temporary
+            op, _, b, c = self.rc.code[-1]
+            self.rc.code[-1] = (op, dst, b, c)
+        else:
+            self.emit(regvm.move, dst, src)
+
+    def visit(self, node: Print):
+        for expr in node.exprs:
+            if isinstance(expr, String):
+                self.emit(regvm.prstr, expr.sym.slot)
+            else:
+                self.emit(regvm.prexpr, self.visit(expr))
+
+    def visit(self, node: While):
+        top = len(self.rc.code)
+        at = self.branch(node.cond)
+        self.visit(node.body)
+        self.emit(regvm.jmp, top)
+        self.patch(at, len(self.rc.code))
+
+    def visit(self, node: If):
+        at = self.branch(node.cond)
+        self.visit(node.stmt)
+        if node.stmt1:
+            end = self.emit(regvm.jmp)
+            self.patch(at, len(self.rc.code))
+            self.visit(node.stmt1)
+            self.patch(end, len(self.rc.code))
+        else:
+            self.patch(at, len(self.rc.code))
+
+    def visit(self, node: Literal):
+        return self.const(node.sym.val)
+
+    def visit(self, node: Variable):
+        sym = node.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            execerror(f"intento de evaluar una no variable '{sym.name}'")
+        self.used[sym.name] = sym
+        return self.var(sym)
+
+    def visit(self, node: Bltin):
+        src = self.visit(node.expr)
+        dst = self.temp()
+        self.emit(regvm.bltin, dst, src, node.sym.ptr)
+        return dst
+
+    def visit(self, node: Binop):
+        left, right = self.operands(node)
+        dst = self.temp()
+        self.emit(self._binop_instr[node.op], dst, left, right)
+        return dst
+
+    def visit(self, node: Unaryop):
+        src = self.visit(node.expr)
+        dst = self.temp()
+        self.emit(self._unaryop_instr[node.op], dst, src)
+        return dst
+
+    def visit(self, node: Preinc):
+        reg = self.incvar(node.sym)
+        self.emit(regvm.inc, reg)
+        return reg
 
     def visit(self, node: Predec):
-        return code2(predec, node.sym)
+        reg = self.incvar(node.sym)
+        self.emit(regvm.dec, reg)
+        return reg
 
     def visit(self, node: Postinc):
-        return code2(postinc, node.sym)
+        dst = self.temp()
+        self.emit(regvm.postinc, dst, self.incvar(node.sym))
+        return dst
 
     def visit(self, node: Postdec):
-        return code2(postdec, node.sym)
+        dst = self.temp()
+        self.emit(regvm.postdec, dst, self.incvar(node.sym))
+        return dst
 
-    def verify(s : Symbol):
-        if s.type != 'VAR' and s.type != 'UNDEF':
-            execerror(f"intento de evaluar una no variable '{s.name}'")
-        if s.type == 'UNDEF':
-            execerror(f"variable no definida '{s.name}'")
+    def incvar(self, sym):
+        self.used[sym.name] = sym
+        self.assigned.add(sym.name)
+        return self.var(sym)
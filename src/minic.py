@@ -1,14 +1,22 @@
 # Fase 1: Calculadora Avanzada
-from errors import CompilerError
+from errors import CompilerError, errors_detected, warning
 from init import *
 from model import *
 from vm import *
-from irgenerator import CodeGenerator
-from rich import print
+from irgenerator import CodeGenerator, RegisterGenerator
+from optimizer import ConstantFolder
 
 import argparse
+import batch
+import bytecode
+import cache
+import hashlib
 import logging
+import os
+import peephole
+import pickle
 import sly
+import stream
 import sys
 	
 # ---------------------------------------------------------------------
@@ -37,6 +45,12 @@ class Lexer(sly.Lexer):
 	# ignore: white-space, comments, newline
 	ignore = ' \t\r'
 	
+	# tabla de simbolos y pool de constantes (por omisión, los globales)
+	def __init__(self, symtab=None, pool=None):
+		self.symtab = symlist if symtab is None else symtab
+		self.pool = constpool if pool is None else pool
+		self.errors = 0     # caracteres ilegales encontrados
+		
 	# Comentarios C-Style
 	@_(r'/\*(.|\n)*?\*/')
 	def ignore_comment(self, t):
@@ -88,36 +102,127 @@ class Lexer(sly.Lexer):
 		
 	@_(r'[a-zA-Z_]\w*')
 	def VAR(self, t):
-		s = lookup(t.value)
+		s = self.symtab.lookup(t.value)
 		if s is None:
-			s = install(t.value, 'UNDEF')
+			s = Symbol(name=t.value, type='UNDEF')
+			self.symtab.add(s)
+		elif s.type == 'VAR':
+			s = self.symtab.own(s)
 		t.type = 'VAR' if s.type == 'UNDEF' else s.type
 		t.value = s
 		return t
 		
 	@_(r'(\d*\.\d+|\d+\.?)([eE][-+]?\d+)?')
 	def NUMBER(self, t):
-		t.value = install('', 'NUMBER', float(t.value))
+		t.value = self.pool.intern('NUMBER', float(t.value))
 		return t
 		
 	@_(r'\"([^\\\n]|(\\.))*?\"')
 	def STRING(self, t):
-		s = install('', 'STRING')
-		s.str = t.value[1:-1]
-		t.value = s
+		t.value = self.pool.intern('STRING', t.value[1:-1])
 		return t
 
 	def error(self, t):
-		print(f"Línea {t.lineno}: Error léxico, '{t.value[0]}' es ilegal")
+		warning(f"Línea {t.lineno}: Error léxico, '{t.value[0]}' es ilegal")
+		self.errors += 1
 		self.index += 1
 
+# ---------------------------------------------------------------------
+# Cache de tablas LALR
+#
+# Construir las tablas de la gramática es la mayor parte del arranque.
+# Se guardan en `tablesfile` junto con un hash de la gramática y se
+# reutilizan mientras la gramática (y la versión de sly) no cambien.
+# ---------------------------------------------------------------------
+TABLES_VERSION = 1
+tablesfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'minic.tab')
+
+# lo que Parser.parse usa de sly.yacc.LRTable
+class ParseTables:
+	def __init__(self, lr_action, lr_goto, defaulted_states):
+		self.lr_action = lr_action
+		self.lr_goto = lr_goto
+		self.defaulted_states = defaulted_states
+		
+def grammar_hash(grammar):
+	h = hashlib.sha256(f'{TABLES_VERSION} sly-{sly.__version__}\n'.encode())
+	for p in grammar.Productions:
+		h.update(f'{p} {p.prec}\n'.encode())
+	h.update(repr(sorted(grammar.Terminals)).encode())
+	h.update(repr(sorted(grammar.Precedence.items())).encode())
+	return h.hexdigest()
+	
+def load_tables(key):
+	try:
+		with open(tablesfile, 'rb') as f:
+			data = pickle.load(f)
+		if data['version'] != TABLES_VERSION or data['sly'] != sly.__version__ \
+				or data['key'] != key:
+			return None
+		tables = ParseTables(data['action'], data['goto'], data['defaulted'])
+	except Exception:
+		# un archivo corrupto o de otra version se trata como si no existiera
+		return None
+	if not (isinstance(tables.lr_action, dict) and isinstance(tables.lr_goto, dict)
+			and isinstance(tables.defaulted_states, dict)):
+		return None
+	return tables
+	
+def save_tables(key, lrtable):
+	data = {
+		'version': TABLES_VERSION,
+		'sly': sly.__version__,
+		'key': key,
+		'action': lrtable.lr_action,
+		'goto': lrtable.lr_goto,
+		'defaulted': lrtable.defaulted_states,
+	}
+	# escribir aparte y renombrar: otro proceso nunca ve el archivo a medias
+	tmp = f'{tablesfile}.{os.getpid()}'
+	try:
+		with open(tmp, 'wb') as f:
+			pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp, tablesfile)
+	except OSError:
+		pass
+		
+class TabledParser(sly.Parser):
+	'''
+	sly.Parser que lee las tablas LALR de `tablesfile` si la gramática no
+	cambió desde que se guardaron. Es lo mismo que sly.Parser._build salvo
+	por ese paso.
+	'''
+	@classmethod
+	def _build(cls, definitions):
+		if vars(cls).get('_build', False):
+			return
+			
+		rules = cls._Parser__collect_rules(definitions)
+		if not cls._Parser__validate_specification():
+			raise sly.yacc.YaccError('Invalid parser specification')
+		cls._Parser__build_grammar(rules)
+		
+		key = grammar_hash(cls._grammar)
+		cls._lrtable = None if cls.debugfile else load_tables(key)
+		if cls._lrtable is None:
+			if not cls._Parser__build_lrtables():
+				raise sly.yacc.YaccError("Can't build parsing tables")
+			save_tables(key, cls._lrtable)
+			
+		if cls.debugfile:
+			with open(cls.debugfile, 'w') as f:
+				f.write(str(cls._grammar))
+				f.write('\n')
+				f.write(str(cls._lrtable))
+				
 # ---------------------------------------------------------------------
 # Analizador Sintático
 # ---------------------------------------------------------------------
-class Parser(sly.Parser):
+class Parser(TabledParser):
 	log = logging.getLogger()
 	log.setLevel(logging.ERROR)
-	debugfile = 'minic.txt'
+	# opcional: MINIC_DEBUGFILE=minic.txt vuelca gramática y tablas
+	debugfile = os.environ.get('MINIC_DEBUGFILE')
 
 	tokens = Lexer.tokens
 
@@ -133,8 +238,11 @@ class Parser(sly.Parser):
 		('right', '^'),
 	)
 
-	def __init__(self):
+	# emit: si se da, recibe cada sentencia o definición de primer nivel en
+	# cuanto se reduce, en lugar de acumularlas en Program.stmts
+	def __init__(self, emit=None):
 		self.indef = False
+		self.emit = emit
 		
 	# warn if illegal definition
 	def defnonly(self, s):
@@ -156,13 +264,22 @@ class Parser(sly.Parser):
 	def list(self, p):
 		return []
 		
+	# las listas se extienden en el lugar: O(1) amortizado por elemento
 	@_("list defn")
 	def list(self, p):
-		return p.list + [ p.defn ]
+		if self.emit is not None:
+			self.emit(p.defn)
+		else:
+			p.list.append(p.defn)
+		return p.list
 		
 	@_("list stmt")
 	def list(self, p):
-		return p.list + [ p.stmt ]
+		if self.emit is not None:
+			self.emit(p.stmt)
+		else:
+			p.list.append(p.stmt)
+		return p.list
 
 	@_("VAR '='   expr",
 		"VAR ADDEQ expr",
@@ -171,7 +288,7 @@ class Parser(sly.Parser):
 		"VAR DIVEQ expr",
 		"VAR MODEQ expr")
 	def asgn(self, p):
-		return Assignment(p[1], Variable(p.VAR), p.expr)
+		return Assignment(p[1], Variable(p.VAR, lineno=p.lineno), p.expr, lineno=p.lineno)
 		
 	@_("RETURN")
 	def stmt(self, p):
@@ -187,11 +304,11 @@ class Parser(sly.Parser):
 		
 	@_("PRINT prlist")
 	def stmt(self, p):
-		return Print(p.prlist)
+		return Print(p.prlist, lineno=p.lineno)
 		
 	@_("WHILE '(' expr ')' stmt")
 	def stmt(self, p):
-		return While(p.expr, p.stmt)
+		return While(p.expr, p.stmt, lineno=p.lineno)
 		
 	@_("FOR '(' expr ';' expr ';' expr ')' stmt")
 	def stmt(self, p):
@@ -199,11 +316,11 @@ class Parser(sly.Parser):
 
 	@_("IF '(' expr ')' stmt ELSE stmt")
 	def stmt(self, p):
-		return If(p.expr, p.stmt0, p.stmt1)
+		return If(p.expr, p.stmt0, p.stmt1, lineno=p.lineno)
 		
 	@_("IF '(' expr ')' stmt")
 	def stmt(self, p):
-		return If(p.expr, p.stmt)
+		return If(p.expr, p.stmt, lineno=p.lineno)
 		
 	@_("asgn")
 	def stmt(self, p):
@@ -211,6 +328,7 @@ class Parser(sly.Parser):
 		
 	@_("expr")
 	def stmt(self, p):
+		p.expr.lineno = p.lineno
 		return p.expr
 		
 	@_("'{' stmtlist '}'")
@@ -223,7 +341,8 @@ class Parser(sly.Parser):
 		
 	@_("stmtlist stmt")
 	def stmtlist(self, p):
-		return p.stmtlist + [p.stmt]
+		p.stmtlist.append(p.stmt)
+		return p.stmtlist
 		
 	@_("NUMBER")
 	def expr(self, p):
@@ -302,11 +421,13 @@ class Parser(sly.Parser):
 		
 	@_("prlist ',' expr")
 	def prlist(self, p):
-		return p.prlist + [ p.expr ]
+		p.prlist.append(p.expr)
+		return p.prlist
 		
 	@_("prlist ',' STRING")
 	def prlist(self, p):
-		return p.prlist + [ String(p.STRING) ]
+		p.prlist.append(String(p.STRING))
+		return p.prlist
 
 	@_("func_header '(' ')' stmt")
 	def defn(self, p):
@@ -354,7 +475,8 @@ class Parser(sly.Parser):
 
 	@_("arglist ',' expr")
 	def arglist(self, p):
-		return p.arglist + [ p.expr ]
+		p.arglist.append(p.expr)
+		return p.arglist
 
 	@_("")
 	def empty(self, p):
@@ -368,8 +490,13 @@ class Parser(sly.Parser):
 		raise CompilerError()
 # ---------------------------------------------------------------------
 # main
+#
+# rich, graphviz y PIL solo se importan con --tokens/--ast, y los backends
+# closure y python solo cuando se eligen: compilar y ejecutar no los carga
+# (regvm es chico y llega con irgenerator, donde esta RegisterGenerator).
 # ---------------------------------------------------------------------
 def print_tokens(tokens):
+	from rich import print
 	for tok in tokens:
 		if isinstance(tok.value, Symbol):
 			if tok.type == 'NUMBER':
@@ -383,6 +510,8 @@ def print_tokens(tokens):
 def print_ast(top):
 	from renderer import DotRender
 	from PIL import Image
+	from rich import print
+	print(top)
 	dot = DotRender.render(top)
 	
 	try:
@@ -398,15 +527,105 @@ def parse_args():
 	parser = argparse.ArgumentParser(description="MiniC compiler")
 	parser.add_argument('input')
 	parser.add_argument('--output', "-o",
-		help="specify output filename (default a.out)",
-		default="a.out")
+		help="write the stack machine bytecode (.mcc) to this file instead of running it (a.out if -o is given without a file)",
+		nargs='?', const="a.out", default=None)
 	parser.add_argument('--tokens', '-t',
 		help='print tokens',
 		dest='tokens', action='store_true')
 	parser.add_argument('--ast',
 		help='generate ast',
 		dest='ast', action='store_true')
-	return parser.parse_args()
+	parser.add_argument('--backend', '-b',
+		help='execution engine (default stack)',
+		choices=['stack', 'register', 'closure', 'python'],
+		default='stack')
+	parser.add_argument('--no-optimize', '-O0',
+		help='skip constant folding and peephole optimization',
+		dest='optimize', action='store_false')
+	parser.add_argument('--no-cache',
+		help='always recompile, ignoring the compilation cache (stack backend)',
+		dest='cache', action='store_false')
+	parser.add_argument('--incremental',
+		help='recompile only the top-level statements that changed since the last run (stack backend)',
+		action='store_true')
+	parser.add_argument('--batch',
+		help='run the program once per record of this CSV/NDJSON file (- for stdin)',
+		metavar='FILE')
+	parser.add_argument('--batch-format',
+		help='format of the --batch records (default from the file name, csv)',
+		choices=['csv', 'ndjson'])
+	parser.add_argument('--vectorize',
+		help='with --batch, evaluate loop-free programs over NumPy arrays',
+		action='store_true')
+	parser.add_argument('--jobs', '-j',
+		help='worker processes for a directory input or --batch (default all cores)',
+		type=int, nargs='?', const=0, default=None)
+	parser.add_argument('--profile',
+		help='count executions and time per instruction and symbol (stack backend)',
+		action='store_true')
+	parser.add_argument('--sample',
+		help='sample the running program every MS ms of CPU and report hot lines and loops',
+		metavar='MS', type=float, nargs='?', const=1.0, default=None)
+	parser.add_argument('--dump-python',
+		help='print the generated Python source (python backend)',
+		dest='dump_python', action='store_true')
+	args = parser.parse_args()
+	if args.incremental and not args.cache:
+		parser.error('--incremental keeps its index in the compilation cache; drop --no-cache')
+	if args.vectorize and args.jobs is not None:
+		parser.error('--vectorize runs in this process; it cannot be combined with --jobs')
+	return args
+	
+# ejecutar el programa de la maquina por omisión
+def run_machine(args, source=None):
+	if args.sample:
+		import sampler
+		s = sampler.Sampler(machine, args.sample / 1000)
+		try:
+			with s:
+				execute()
+		finally:
+			s.report(source)
+		return
+	if not args.profile:
+		execute()
+		return
+	import profiler
+	prof = profiler.Profile()
+	try:
+		profiler.execute(machine, prof=prof)
+	finally:
+		profiler.report(prof)
+			
+# compilar desde un mmap del fuente, sentencia por sentencia (stream.py),
+# salvo que el mismo fuente ya esté en el cache, y ejecutar o guardar. Con
+# --incremental, las sentencias que no cambiaron desde la compilación
+# anterior del archivo no se vuelven a compilar (incremental.py). Un
+# programa que dio errores o avisos al compilarse no se guarda en el cache:
+# un acierto no los volvería a mostrar.
+def run_streamed(args):
+	with stream.open_source(args.input) as buf:
+		key = None
+		if args.cache and not args.output:
+			key = cache.key(buf, args.optimize)
+		if key is None or not cache.load(key):
+			before = errors_detected()
+			if args.incremental:
+				import incremental
+				incremental.compile(buf, args.input, args.optimize)
+			else:
+				stream.compile(buf, args.optimize)
+			if key is not None and errors_detected() == before:
+				cache.store(key)
+	if args.output:
+		bytecode.save(args.output)
+		return
+	dump()
+	source = None
+	if args.sample:
+		with open(args.input, 'r') as f:
+			source = f.read()
+	run_machine(args, source)
 	
 def run_compiler(args):
 	lexer = Lexer()
@@ -415,6 +634,44 @@ def run_compiler(args):
 	#flow_generator = FlowGraph()
 	source_code = ''
 	
+	# un directorio: todos sus .mc, repartidos entre procesos
+	if os.path.isdir(args.input):
+		import runner
+		failed = False
+		for path, output, error in runner.run_files(runner.sources(args.input),
+				args.jobs or None, args.optimize):
+			print(f'==> {path} <==')
+			print(output, end='')
+			if error:
+				logging.error(f'{path}: {error}')
+				failed = True
+		if failed:
+			exit(1)
+		return
+		
+	# bytecode ya compilado: directo a la VM
+	if bytecode.is_bytecode(args.input):
+		try:
+			bytecode.load_file(args.input)
+			run_machine(args)
+		except CompilerError as e:
+			logging.error("COMPILER_ERROR: {0}".format(str(e)))
+			exit(1)
+		return
+		
+	# maquina de pila: sin leer el fuente entero ni armar el AST completo
+	if args.backend == 'stack' and not (args.tokens or args.ast or args.batch):
+		try:
+			run_streamed(args)
+		except FileNotFoundError:
+			logging.error("File not found")
+			exit(1)
+		except CompilerError as e:
+			if str(e):
+				logging.error("COMPILER_ERROR: {0}".format(str(e)))
+			exit(1)
+		return
+		
 	try:
 		with open(args.input, 'r') as f:
 			source_code = f.read()
@@ -423,6 +680,18 @@ def run_compiler(args):
 		exit(1)
 		
 	try:
+		# variables de entrada del modo por lotes, antes de parsear
+		if args.batch:
+			if args.backend != 'stack' or args.output:
+				raise CompilerError('--batch solo esta disponible con el backend stack')
+			fmt = args.batch_format or batch.guess_format(args.batch)
+			try:
+				infile = sys.stdin if args.batch == '-' else open(args.batch, newline='')
+			except OSError as e:
+				raise CompilerError(f'{args.batch}: {e.strerror}')
+			records, inputs = batch.open_records(infile, fmt)
+			batch.declare(inputs)
+			
 		# group tokens into syntactical units using parser
 		tokens = lexer.tokenize(source_code)
 		if args.tokens:
@@ -431,17 +700,41 @@ def run_compiler(args):
 			exit(0)
 			
 		top = parser.parse(tokens)
-		print(top)
+		if args.optimize:
+			top = ConstantFolder.optimize(top)
 		if args.ast:
 			print_ast(top)
 			exit(0)
 		
+		if args.batch:
+			program = batch.BatchProgram.generate(top, inputs, args.optimize)
+			if args.jobs is not None:
+				import runner
+				runner.run_program(program, records, args.jobs)
+			elif args.vectorize:
+				import vectorize
+				vectorize.run_all(top, program, records)
+			else:
+				program.run_all(records)
+			return
+			
 		# generate code
-		CodeGenerator.generate(top)
-		
-		for line, instr in enumerate(prog):
-			pprint(line, instr)
-		execute()
+		if args.output and args.backend != 'stack':
+			raise CompilerError('--output solo esta disponible con el backend stack')
+		if args.backend == 'register':
+			import regvm
+			rc = RegisterGenerator.generate(top)
+			regvm.dump(rc)
+			regvm.run(rc)
+		elif args.backend == 'closure':
+			import closures
+			closures.ClosureGenerator.generate(top)()
+		elif args.backend == 'python':
+			import pygenerator
+			pycode = pygenerator.PythonGenerator.generate(top)
+			if args.dump_python:
+				print(pycode.source, end='')
+			pygenerator.run(pycode)
 		
 		# perform semantic analyze
 		#symtab, ast = analyzer.analyze(parse_tree)
@@ -1,8 +1,10 @@
 # definición de Estructuras de datos
 from collections import deque
-from dataclasses import dataclass, field
-from multimethod import multimeta
-from typing import Any, List, Callable
+from dataclasses import dataclass, field, replace
+from types import UnionType
+from typing import Any, List, Callable, Union, get_args, get_origin
+
+import math
 
 
 # Entrada a la tabla de simbol
@@ -14,17 +16,74 @@ class Symbol:
 	ptr : Callable = None
 	defn: int = 0           # FUNCTION, PROCEDURE
 	str : str = None        # STRING
+	slot: int = 0           # NUMBER, STRING: posición en el pool
 	
 	
 #----------------------------------------
 # Patron Visitor
-class Visitor(metaclass=multimeta):
-	pass
+#
+# Cada clase Visitor define un `def visit(self, node: T)` por tipo de
+# nodo. La metaclase los junta en una tabla tipo -> función al crear la
+# clase, y visit() despacha con un solo acceso a dict por type(node).
+# Los subtipos (p.ej. un nodo visitado como Expression) se resuelven
+# recorriendo el MRO la primera vez y quedan en la tabla.
+class VisitorDict(dict):
+
+	def __init__(self):
+		super().__init__()
+		self.visits = []
+		
+	def __setitem__(self, key, value):
+		if key == 'visit' and getattr(value, '__annotations__', None):
+			self.visits.append(value)
+		else:
+			super().__setitem__(key, value)
+			
+class VisitorMeta(type):
+
+	@classmethod
+	def __prepare__(meta, name, bases):
+		return VisitorDict()
+		
+	def __new__(meta, name, bases, namespace):
+		cls = super().__new__(meta, name, bases, dict(namespace))
+		table = {}
+		for base in reversed(cls.__mro__[1:]):
+			table.update(getattr(base, '_visit_table', {}))
+		for func in namespace.visits:
+			param = func.__code__.co_varnames[1]
+			for t in visit_types(func.__annotations__[param]):
+				table[t] = func
+		cls._visit_table = table
+		return cls
+		
+# tipos de una anotación: T, T1 | T2 o Union[T1, T2]
+def visit_types(annotation):
+	if isinstance(annotation, UnionType) or get_origin(annotation) is Union:
+		return get_args(annotation)
+	return (annotation,)
+	
+class Visitor(metaclass=VisitorMeta):
+
+	def visit(self, node, *args, **kwargs):
+		table = self._visit_table
+		func = table.get(type(node))
+		if func is None:
+			for t in type(node).__mro__:
+				if t in table:
+					func = table[type(node)] = table[t]
+					break
+			else:
+				raise TypeError(f'{type(self).__name__}: no hay visit para {type(node).__name__}')
+		return func(self, node, *args, **kwargs)
 	
 #----------------------------------------
 # Estructura AST
 @dataclass
 class Node:
+	# línea del fuente donde empieza (0 si no se conoce)
+	lineno : int = field(default=0, compare=False, repr=False, kw_only=True)
+	
 	def accept(self, visitor: Visitor, *args, **kwargs):
 		return visitor.visit(self, *args, **kwargs)
 		
@@ -126,28 +185,102 @@ class Stack(deque):
 		return self[-1]
 		
 #----------------------------------------
-# Tabla de Simbolos (Patron Iterator)
-@dataclass
-class LinkedListIterator:
-	current : Symbol
-	
+# Pool de Constantes
+#
+# Los literales se internan por (tipo, valor): todas las apariciones de
+# `1` o de "\n" comparten un mismo Symbol y un mismo slot. `values`
+# guarda el valor listo para la VM (float, o el string ya con los
+# escapes resueltos) en el mismo orden que `consts`.
+class ConstPool:
+
+	def __init__(self):
+		self.consts = []        # slot -> Symbol
+		self.values = []        # slot -> float | str
+		self.index  = {}        # (type, value[, sign]) -> Symbol
+		
+	def __len__(self):
+		return len(self.consts)
+		
 	def __iter__(self):
-		return self
+		return iter(self.consts)
 		
-	def __next__(self):
-		if not self.current:
-			raise StopIteration
-		sym, self.current = self.current, self.current.next
-		return sym
+	def __getitem__(self, slot):
+		return self.consts[slot]
+		
+	def intern(self, type, value):
+		key = (type, value)
+		if type != 'STRING':
+			# 0.0 == -0.0, pero no son la misma constante
+			key += (math.copysign(1.0, value),)
+		sp  = self.index.get(key)
+		if sp is None:
+			sp = Symbol(name='', type=type, slot=len(self.consts))
+			if type == 'STRING':
+				sp.str = value
+				value  = value.replace('\\n', '\n')
+			else:
+				sp.val = value
+			self.consts.append(sp)
+			self.values.append(value)
+			self.index[key] = sp
+		return sp
+		
+	def clear(self):
+		# en el lugar: la VM guarda una referencia a `values`
+		self.consts.clear()
+		self.values.clear()
+		self.index.clear()
+		
+#----------------------------------------
+# Tabla de Simbolos (Patron Iterator)
+#
+# Cada alcance (scope) es un dict nombre -> Symbol, de modo que
+# lookup/install son O(1). La búsqueda recorre los alcances desde el
+# más interno hasta el global.
+class SymbolTable:
+
+	def __init__(self, base=None):
+		# base: tabla de solo lectura por debajo del alcance global
+		self.scopes = [ {} ] if base is None else [ base.scopes[0], {} ]
+		self.fixed = len(self.scopes)
 		
-@dataclass
-class LinkedList:
-	sym : Symbol = None
-	
 	def __iter__(self):
-		return LinkedListIterator(self.sym)
+		# igual que la lista enlazada: primero lo último instalado
+		for scope in reversed(self.scopes):
+			yield from reversed(scope.values())
+			
+	def __len__(self):
+		return sum(len(scope) for scope in self.scopes)
+		
+	def __contains__(self, name):
+		return self.lookup(name) is not None
+		
+	def lookup(self, name):
+		for scope in reversed(self.scopes):
+			sp = scope.get(name)
+			if sp is not None:
+				return sp
+		return None
 		
 	def add(self, sym):
-		sym.next = self.sym
-		self.sym = sym
-
+		self.scopes[-1][sym.name] = sym
+		
+	# una variable de la tabla base (PI, E, ...) se copia al alcance
+	# global la primera vez que se usa: asignarla no cambia la compartida
+	def own(self, sym):
+		if self.fixed > 1 and self.scopes[0].get(sym.name) is sym:
+			sym = replace(sym)
+			self.scopes[self.fixed-1][sym.name] = sym
+		return sym
+		
+	# olvidar todo lo instalado, menos la tabla base
+	def clear(self):
+		self.scopes[self.fixed-1:] = [ {} ]
+		
+	def enter(self):
+		self.scopes.append({})
+		
+	def leave(self):
+		if len(self.scopes) == self.fixed:
+			raise IndexError('no se puede cerrar el alcance global')
+		return self.scopes.pop()
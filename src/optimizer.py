@@ -0,0 +1,158 @@
+# Optimizaciones sobre el AST
+#
+# Se aplica entre Parser.parse y la generación de código, y la usan todos
+# los backends:
+#
+#   - plegado de constantes: 2*PI, sqrt(2), 1 < 2 ... se calculan al compilar
+#   - las constantes de init.consts (PI, E, ...) se tratan como literales
+#     siempre que el programa no las asigne
+#   - identidades: x+0, x-0, x*1, x/1, x^1, --x
+#   - if/while con condición constante se reducen a la rama que se ejecuta
+#
+# Las operaciones que fallarían en ejecución (división por cero, sqrt(-1))
+# no se pliegan, para que el error se siga produciendo en la VM.
+from dataclasses import fields
+from init import consts, constpool
+from math import fmod
+from model import *
+
+_binop = {
+    '+'  : lambda a, b: a + b,
+    '-'  : lambda a, b: a - b,
+    '*'  : lambda a, b: a * b,
+    '/'  : lambda a, b: a / b,
+    '%'  : fmod,
+    '^'  : pow,
+    '<'  : lambda a, b: float(a < b),
+    '<=' : lambda a, b: float(a <= b),
+    '>'  : lambda a, b: float(a > b),
+    '>=' : lambda a, b: float(a >= b),
+    '==' : lambda a, b: float(a == b),
+    '!=' : lambda a, b: float(a != b),
+    '&&' : lambda a, b: float(a != 0.0 and b != 0.0),
+    '||' : lambda a, b: float(a != 0.0 or b != 0.0),
+}
+
+# value of a constant expression, or None
+def value(node):
+    if isinstance(node, Literal):
+        return node.sym.val
+    return None
+
+# names assigned (or incremented) anywhere in the tree
+def assigned_names(node, names=None):
+    if names is None:
+        names = set()
+    if isinstance(node, list):
+        for n in node:
+            assigned_names(n, names)
+    elif isinstance(node, Node):
+        if isinstance(node, Assignment):
+            names.add(node.var.sym.name)
+        elif isinstance(node, (Preinc, Predec, Postinc, Postdec)):
+            names.add(node.sym.name)
+        for f in fields(node):
+            assigned_names(getattr(node, f.name), names)
+    return names
+
+class ConstantFolder(Visitor):
+    '''
+    Devuelve un AST equivalente con las subexpresiones constantes ya
+    calculadas. Las sentencias eliminadas desaparecen de sus listas.
+    '''
+
+    def __init__(self, assigned=(), pool=None):
+        self.assigned = assigned
+        self.pool = constpool if pool is None else pool   # for new literals
+
+    @classmethod
+    def optimize(cls, model, pool=None):
+        return model.accept(cls(assigned_names(model), pool))
+
+    def literal(self, val, lineno=0):
+        return Literal(self.pool.intern('NUMBER', val), lineno=lineno)
+
+    # statement list for a body that may be a single statement
+    def block(self, stmts):
+        return self.visit(stmts if isinstance(stmts, list) else [stmts])
+
+    def visit(self, node: Program):
+        return Program(self.visit(node.stmts))
+
+    def visit(self, node: list):
+        stmts = []
+        for stmt in node:
+            stmt = self.visit(stmt)
+            if isinstance(stmt, list):
+                stmts.extend(stmt)
+            elif stmt is not None:
+                stmts.append(stmt)
+        return stmts
+
+    def visit(self, node: Assignment):
+        return Assignment(node.op, node.var, self.visit(node.expr), lineno=node.lineno)
+
+    def visit(self, node: Print):
+        return Print([self.visit(expr) for expr in node.exprs], lineno=node.lineno)
+
+    def visit(self, node: While):
+        cond = self.visit(node.cond)
+        if value(cond) == 0.0:
+            return None
+        return While(cond, self.block(node.body), lineno=node.lineno)
+
+    def visit(self, node: If):
+        cond = self.visit(node.cond)
+        val = value(cond)
+        if val is None:
+            return If(cond, self.block(node.stmt), self.block(node.stmt1), lineno=node.lineno)
+        return self.block(node.stmt if val else node.stmt1)
+
+    def visit(self, node: Literal | String | Preinc | Predec | Postinc | Postdec):
+        return node
+
+    def visit(self, node: Variable):
+        sym = node.sym
+        if sym.name in consts and sym.type == 'VAR' and sym.name not in self.assigned:
+            return self.literal(sym.val, node.lineno)
+        return node
+
+    def visit(self, node: Bltin):
+        expr = self.visit(node.expr)
+        arg = value(expr)
+        if arg is not None:
+            try:
+                return self.literal(float(node.sym.ptr(arg)), node.lineno)
+            except (ValueError, OverflowError):
+                pass
+        return Bltin(node.sym, expr, lineno=node.lineno)
+
+    def visit(self, node: Binop):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        a, b = value(left), value(right)
+        if a is not None and b is not None:
+            try:
+                val = _binop[node.op](a, b)
+                if isinstance(val, float):
+                    return self.literal(val, node.lineno)
+            except (ZeroDivisionError, ValueError, OverflowError):
+                pass
+        elif node.op in ('+', '-') and b == 0.0:
+            return left
+        elif node.op == '+' and a == 0.0:
+            return right
+        elif node.op in ('*', '/', '^') and b == 1.0:
+            return left
+        elif node.op == '*' and a == 1.0:
+            return right
+        return Binop(node.op, left, right, lineno=node.lineno)
+
+    def visit(self, node: Unaryop):
+        expr = self.visit(node.expr)
+        val = value(expr)
+        if val is not None:
+            return self.literal(-val if node.op == '-' else float(val == 0.0), node.lineno)
+        if node.op == '-' and isinstance(expr, Unaryop) and expr.op == '-':
+            return expr.expr
+        return Unaryop(node.op, expr, lineno=node.lineno)
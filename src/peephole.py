@@ -0,0 +1,95 @@
+# Optimizador peephole para la maquina de pila
+#
+# Recorre `prog` despues de CodeGenerator.generate y reemplaza pares de
+# instrucciones frecuentes por una superinstruccion de vm.py:
+#
+#   store s;    pop          ->  storepop s
+#   preinc s;   xpop         ->  incvar s      (tambien postinc, --)
+#   constpush k; add         ->  addconst k    (tambien sub, mul)
+#   lt;         jz L         ->  jnlt L        (y el resto de comparaciones)
+#
+# Un par no se fusiona si su segunda instruccion es destino de un salto.
+# Al final se reubican las direcciones de todos los saltos y, si se da,
+# la tabla pc -> linea. Con `start` solo se optimiza el codigo desde esa
+# direccion (stream.py lo hace con cada sentencia de primer nivel, cuyos
+# saltos quedan dentro de ella).
+from vm import *
+
+import vm
+
+# (first, second) -> fused instruction; operands of first unless noted
+_pairs = {
+    (store, pop)      : storepop,
+    (store, xpop)     : storepop,
+    (preinc, xpop)    : incvar,
+    (postinc, xpop)   : incvar,
+    (predec, xpop)    : decvar,
+    (postdec, xpop)   : decvar,
+    (constpush, add)  : addconst,
+    (constpush, sub)  : subconst,
+    (constpush, mul)  : mulconst,
+}
+
+# comparison; jz -> compare and branch, keeps the operand of jz
+_branches = {
+    lt : jnlt,
+    le : jnle,
+    gt : jngt,
+    ge : jnge,
+    eq : jneq,
+    ne : jnne,
+}
+
+# split prog into [addr, instr, operands]
+def decode(code, start=0):
+    instrs = []
+    addr = start
+    while addr < len(code):
+        instr = code[addr]
+        n = vm._noperands.get(instr, 0)
+        instrs.append([addr, instr, code[addr+1:addr+1+n]])
+        addr += 1 + n
+    return instrs
+
+def optimize(code=None, lines=None, start=0):
+    if code is None:
+        code = prog
+        lines = machine.lines
+    instrs = decode(code, start)
+    targets = {ops[0] for _, instr, ops in instrs if instr in vm._jump_instr}
+
+    fused = []
+    i = 0
+    while i < len(instrs):
+        addr, first, ops = instrs[i]
+        if i + 1 < len(instrs) and instrs[i+1][0] not in targets:
+            _, second, ops2 = instrs[i+1]
+            if (first, second) in _pairs:
+                fused.append([addr, _pairs[first, second], ops, instrs[i+1][0]])
+                i += 2
+                continue
+            if first in _branches and second is jz:
+                fused.append([addr, _branches[first], ops2, instrs[i+1][0]])
+                i += 2
+                continue
+        fused.append(instrs[i])
+        i += 1
+
+    # encode again, mapping old addresses to new ones
+    relocated = {}
+    out = []
+    for addr, instr, ops, *absorbed in fused:
+        relocated[addr] = start + len(out)
+        for a in absorbed:
+            relocated[a] = start + len(out)
+        out.append(instr)
+        out.extend(ops)
+    relocated[len(code)] = start + len(out)
+    for addr, instr, ops, *_ in fused:
+        if instr in vm._jump_instr:
+            at = relocated[addr] + 1 - start
+            out[at] = relocated[out[at]]
+    code[start:] = out
+    if lines is not None:
+        lines.relocate(relocated, start)
+    return code
@@ -0,0 +1,71 @@
+# Perfilador de la maquina de pila (--profile)
+#
+# execute() es una copia del bucle de Machine.execute que ademas cuenta
+# cuantas veces se ejecuta cada instruccion y cuanto tiempo lleva, y lo
+# atribuye tambien a la variable (slot de data) o builtin que toca. El
+# bucle normal no cambia: sin --profile no hay ningun costo.
+from collections import defaultdict
+from vm import STOP, _slot_instr, bltin
+
+import sys
+import time
+
+class Profile:
+
+    def __init__(self):
+        self.counts = defaultdict(int)      # instruction -> executions
+        self.times  = defaultdict(float)    # instruction -> seconds
+        self.scounts = defaultdict(int)     # variable/builtin name -> executions
+        self.stimes  = defaultdict(float)   # variable/builtin name -> seconds
+        self.total  = 0.0                   # wall time of the whole run
+
+# run m from p; prof (filled as it runs) is still usable if it raises
+def execute(m, p: int=0, prof=None) -> Profile:
+    if prof is None:
+        prof = Profile()
+    counts, times = prof.counts, prof.times
+    scounts, stimes = prof.scounts, prof.stimes
+    clock = time.perf_counter
+    prog = m.prog
+    start = clock()
+    try:
+        m.pc = p
+        instr = prog[p]
+        while instr is not STOP:
+            operand = m.pc + 1
+            m.pc = operand
+            t0 = clock()
+            instr(m)
+            dt = clock() - t0
+            counts[instr] += 1
+            times[instr] += dt
+            if instr in _slot_instr:
+                name = m.symbols[prog[operand]].name
+            elif instr is bltin:
+                name = prog[operand].name + '()'
+            else:
+                name = None
+            if name is not None:
+                scounts[name] += 1
+                stimes[name] += dt
+            instr = prog[m.pc]
+    finally:
+        prof.total = clock() - start
+    return prof
+
+def report(prof: Profile, file=None):
+    if file is None:
+        file = sys.stderr
+    total = sum(prof.times.values()) or 1.0
+    print(f'\nperfil: {sum(prof.counts.values())} instrucciones en '
+          f'{prof.total * 1e3:.3f} ms', file=file)
+    print(f'{"instruccion":<12} {"veces":>10} {"ms":>10} {"%":>6} {"ns/instr":>9}', file=file)
+    for instr, t in sorted(prof.times.items(), key=lambda it: -it[1]):
+        n = prof.counts[instr]
+        print(f'{instr.__name__:<12} {n:>10} {t * 1e3:>10.3f} {100 * t / total:>6.1f} '
+              f'{t / n * 1e9:>9.0f}', file=file)
+    if prof.scounts:
+        print(f'\n{"simbolo":<12} {"veces":>10} {"ms":>10} {"%":>6}', file=file)
+        for name, t in sorted(prof.stimes.items(), key=lambda it: -it[1]):
+            print(f'{name:<12} {prof.scounts[name]:>10} {t * 1e3:>10.3f} '
+                  f'{100 * t / total:>6.1f}', file=file)
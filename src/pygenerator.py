@@ -0,0 +1,240 @@
+# Backend Python
+#
+# Traduce el AST a código fuente Python equivalente (While -> while,
+# Binop -> operador nativo, Bltin -> math.*), lo compila una sola vez con
+# compile() y guarda el code object, de modo que los bucles corren como
+# bytecode de CPython en vez de pasar por el intérprete de vm.py.
+#
+# Las variables de MiniC son locales de la función generada: se cargan de
+# sus Symbol al entrar y se guardan de vuelta al salir.
+from dataclasses import dataclass, field
+from errors import execerror
+from init import builtins, constpool
+from irgenerator import has_effects
+from model import *
+
+import math
+
+# generated program
+@dataclass
+class PyCode:
+    source : str = ''
+    syms   : list = field(default_factory=list)   # Symbol of each variable
+
+_assign_op = {
+    '='  : '=',
+    '+=' : '+=',
+    '-=' : '-=',
+    '*=' : '*=',
+    '/=' : '/=',
+}
+
+_binop = {
+    '+'  : '+',
+    '-'  : '-',
+    '*'  : '*',
+    '/'  : '/',
+    '^'  : '**',
+}
+
+_relop = {
+    '<'  : '<',
+    '<=' : '<=',
+    '>'  : '>',
+    '>=' : '>=',
+    '==' : '==',
+    '!=' : '!=',
+}
+
+class PythonGenerator(Visitor):
+    '''
+    Las sentencias se emiten como líneas en self.lines y las
+    expresiones devuelven el texto Python que las calcula.
+    '''
+
+    def __init__(self):
+        self.lines = []
+        self.depth = 1
+        self.vars = {}          # name -> Symbol, in order of appearance
+        self.assigned = set()   # names written somewhere in the program
+        self.used = set()       # names read
+
+    @classmethod
+    def generate(cls, model):
+        generator = cls()
+        model.accept(generator)
+        return generator.pycode()
+
+    def emit(self, line):
+        self.lines.append('    ' * self.depth + line)
+
+    def var(self, sym):
+        self.vars.setdefault(sym.name, sym)
+        return f'v_{sym.name}'
+
+    def pycode(self):
+        syms = list(self.vars.values())
+        head = ['def main(syms):']
+        head += [f'    v_{sym.name} = syms[{i}].val' for i, sym in enumerate(syms)]
+        head += ['    try:']
+        body = ['    ' + line for line in self.lines] or ['        pass']
+        tail = ['    finally:']
+        tail += [f'        syms[{i}].val = v_{sym.name}' for i, sym in enumerate(syms)]
+        if not syms:
+            tail.append('        pass')
+        return PyCode('\n'.join(head + body + tail) + '\n', syms)
+
+    # python expression for the truth value of a while/if condition
+    def test(self, node):
+        if isinstance(node, Binop):
+            if node.op in _relop:
+                return f'{self.visit(node.left)} {_relop[node.op]} {self.visit(node.right)}'
+            if node.op in ('&&', '||') and not has_effects(node.right):
+                op = 'and' if node.op == '&&' else 'or'
+                return f'({self.test(node.left)}) {op} ({self.test(node.right)})'
+        if isinstance(node, Unaryop) and node.op == '!':
+            return f'not ({self.test(node.expr)})'
+        return self.visit(node)
+
+    def block(self, stmts):
+        self.depth += 1
+        n = len(self.lines)
+        self.visit(stmts if isinstance(stmts, list) else [stmts])
+        if len(self.lines) == n:
+            self.emit('pass')
+        self.depth -= 1
+
+    def visit(self, node: Program):
+        self.visit(node.stmts)
+        for name in self.used:
+            if name not in self.assigned and self.vars[name].type == 'UNDEF':
+                execerror(f"variable no definida '{name}'")
+
+    def visit(self, node: list):
+        for stmt in node:
+            if isinstance(stmt, Expression):
+                self.emit(self.visit(stmt))
+            else:
+                self.visit(stmt)
+
+    def visit(self, node: Assignment):
+        sym = node.var.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            execerror(f'asignacion a no variable {sym.name}')
+        self.assigned.add(sym.name)
+        var = self.var(sym)
+        expr = self.visit(node.expr)
+        if node.op != '=' and has_effects(node.expr):
+            # ++/-- on the right happen before var is read, as in the stack machine
+            self.emit(f'rhs = {expr}')
+            expr = 'rhs'
+        if node.op == '%=':
+            self.emit(f'{var} = fmod({var}, {expr})')
+        else:
+            self.emit(f'{var} {_assign_op[node.op]} {expr}')
+
+    def visit(self, node: Print):
+        for expr in node.exprs:
+            if isinstance(expr, String):
+                self.emit(f"print({constpool.values[expr.sym.slot]!r}, end='')")
+            else:
+                self.emit(f"print('%.12g ' % ({self.visit(expr)}), end='')")
+
+    def visit(self, node: While):
+        self.emit(f'while {self.test(node.cond)}:')
+        self.block(node.body)
+
+    def visit(self, node: If):
+        self.emit(f'if {self.test(node.cond)}:')
+        self.block(node.stmt)
+        if node.stmt1:
+            self.emit('else:')
+            self.block(node.stmt1)
+
+    def visit(self, node: Literal):
+        val = node.sym.val
+        if not math.isfinite(val):
+            return f"float('{val}')"
+        # a folded -1.0 must stay one operand: -1.0 ** y is -(1.0 ** y)
+        return repr(val) if math.copysign(1.0, val) > 0 else f'({val!r})'
+
+    def visit(self, node: Variable):
+        sym = node.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            execerror(f"intento de evaluar una no variable '{sym.name}'")
+        self.used.add(sym.name)
+        return self.var(sym)
+
+    def visit(self, node: Bltin):
+        func = node.sym.ptr
+        if getattr(func, '__module__', None) == 'math':
+            name = f'math.{func.__name__}'
+        else:
+            name = f'b_{node.sym.name}'
+        return f'{name}({self.visit(node.expr)})'
+
+    def visit(self, node: Binop):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if node.op in _binop:
+            return f'({left} {_binop[node.op]} {right})'
+        if node.op == '%':
+            return f'fmod({left}, {right})'
+        if node.op in _relop:
+            return f'(1.0 if {left} {_relop[node.op]} {right} else 0.0)'
+        if has_effects(node.right):
+            # both sides are always evaluated, as in the stack machine
+            op = '&' if node.op == '&&' else '|'
+            return f'(1.0 if ({left} != 0.0) {op} ({right} != 0.0) else 0.0)'
+        op = 'and' if node.op == '&&' else 'or'
+        return f'(1.0 if {left} != 0.0 {op} {right} != 0.0 else 0.0)'
+
+    def visit(self, node: Unaryop):
+        expr = self.visit(node.expr)
+        if node.op == '-':
+            return f'(-{expr})'
+        return f'(1.0 if {expr} == 0.0 else 0.0)'
+
+    def visit(self, node: Preinc):
+        var = self.incvar(node.sym)
+        return f'({var} := {var} + 1.0)'
+
+    def visit(self, node: Predec):
+        var = self.incvar(node.sym)
+        return f'({var} := {var} - 1.0)'
+
+    def visit(self, node: Postinc):
+        var = self.incvar(node.sym)
+        return f'({var}, ({var} := {var} + 1.0))[0]'
+
+    def visit(self, node: Postdec):
+        var = self.incvar(node.sym)
+        return f'({var}, ({var} := {var} - 1.0))[0]'
+
+    def incvar(self, sym):
+        self.used.add(sym.name)
+        self.assigned.add(sym.name)
+        return self.var(sym)
+
+# compiled code objects, by generated source
+_cache = {}
+
+def compile_source(source):
+    code = _cache.get(source)
+    if code is None:
+        code = _cache[source] = compile(source, '<minic>', 'exec')
+    return code
+
+# forget every compiled code object, so the next run compiles again
+def clear_cache():
+    _cache.clear()
+
+def run(pycode: PyCode):
+    namespace = {'math': math, 'fmod': math.fmod}
+    namespace.update((f'b_{name}', func) for name, func in builtins.items())
+    exec(compile_source(pycode.source), namespace)
+    try:
+        namespace['main'](pycode.syms)
+    except ZeroDivisionError:
+        execerror('division por cero')
+        raise
@@ -0,0 +1,192 @@
+# Maquina virtual de registros
+#
+# Alternativa a la maquina de pila de vm.py. Cada instruccion es una
+# tupla de tres direcciones (op, a, b, c) sobre un banco de registros
+# de floats: las variables y las constantes viven en registros propios
+# y los temporales se reutilizan entre sentencias, de modo que `x = x + 1`
+# es una sola instruccion y no se crea ningun objeto por operacion.
+#
+# Una instruccion devuelve None para seguir con la siguiente, o el
+# indice de destino si es un salto.
+from dataclasses import dataclass, field
+from errors import execerror
+from init import constpool
+from math import fmod
+
+consts = constpool.values   # literal values, indexed by pool slot
+
+# compiled program for the register machine
+@dataclass
+class RegCode:
+    code : list = field(default_factory=list)   # (op, a, b, c)
+    regs : list = field(default_factory=list)   # initial register file
+    syms : list = field(default_factory=list)   # (reg, Symbol) of variables
+
+# arithmetic: r[a] = r[b] op r[c]
+def add(r, a, b, c):
+    r[a] = r[b] + r[c]
+
+def sub(r, a, b, c):
+    r[a] = r[b] - r[c]
+
+def mul(r, a, b, c):
+    r[a] = r[b] * r[c]
+
+def div(r, a, b, c):
+    if r[c] == 0.0:
+        execerror('division por cero')
+    r[a] = r[b] / r[c]
+
+def mod(r, a, b, c):
+    if r[c] == 0.0:
+        execerror('division por cero')
+    r[a] = fmod(r[b], r[c])
+
+def power(r, a, b, c):
+    r[a] = pow(r[b], r[c])
+
+def lt(r, a, b, c):
+    r[a] = float(r[b] < r[c])
+
+def le(r, a, b, c):
+    r[a] = float(r[b] <= r[c])
+
+def gt(r, a, b, c):
+    r[a] = float(r[b] > r[c])
+
+def ge(r, a, b, c):
+    r[a] = float(r[b] >= r[c])
+
+def eq(r, a, b, c):
+    r[a] = float(r[b] == r[c])
+
+def ne(r, a, b, c):
+    r[a] = float(r[b] != r[c])
+
+def and_(r, a, b, c):
+    r[a] = float(r[b] != 0.0 and r[c] != 0.0)
+
+def or_(r, a, b, c):
+    r[a] = float(r[b] != 0.0 or r[c] != 0.0)
+
+# unary: r[a] = op r[b]
+def negate(r, a, b, c):
+    r[a] = -r[b]
+
+def not_(r, a, b, c):
+    r[a] = float(r[b] == 0.0)
+
+def move(r, a, b, c):
+    r[a] = r[b]
+
+# r[a] = builtin c applied to r[b]
+def bltin(r, a, b, c):
+    r[a] = c(r[b])
+
+# r[a] = r[b]; r[b] += 1 (post-increment into a temporary)
+def postinc(r, a, b, c):
+    r[a] = r[b]
+    r[b] += 1.0
+
+def postdec(r, a, b, c):
+    r[a] = r[b]
+    r[b] -= 1.0
+
+def inc(r, a, b, c):
+    r[a] += 1.0
+
+def dec(r, a, b, c):
+    r[a] -= 1.0
+
+# jumps: target in the last used operand
+def jmp(r, a, b, c):
+    return a
+
+def jz(r, a, b, c):
+    if not r[a]:
+        return b
+
+# compare and branch: jump to c unless r[a] op r[b]
+def jnlt(r, a, b, c):
+    if not r[a] < r[b]:
+        return c
+
+def jnle(r, a, b, c):
+    if not r[a] <= r[b]:
+        return c
+
+def jngt(r, a, b, c):
+    if not r[a] > r[b]:
+        return c
+
+def jnge(r, a, b, c):
+    if not r[a] >= r[b]:
+        return c
+
+def jneq(r, a, b, c):
+    if not r[a] == r[b]:
+        return c
+
+def jnne(r, a, b, c):
+    if not r[a] != r[b]:
+        return c
+
+# print numeric register
+def prexpr(r, a, b, c):
+    print('%.12g ' % r[a], end='')
+
+# print string constant from the pool
+def prstr(r, a, b, c):
+    print(consts[a], end='')
+
+# run the machine
+def execute(code, regs):
+    pc  = 0
+    end = len(code)
+    while pc < end:
+        op, a, b, c = code[pc]
+        target = op(regs, a, b, c)
+        pc = pc + 1 if target is None else target
+
+# load variables, run, and store the variables back in their symbols
+def run(rc: RegCode):
+    regs = list(rc.regs)
+    for reg, sym in rc.syms:
+        regs[reg] = sym.val
+    execute(rc.code, regs)
+    for reg, sym in rc.syms:
+        sym.val = regs[reg]
+    return regs
+
+# operand position that holds a jump target
+_targets = {
+    jmp: 0, jz: 1,
+    jnlt: 2, jnle: 2, jngt: 2, jnge: 2, jneq: 2, jnne: 2,
+}
+
+def pprint(line, instr, names=None):
+    if names is None:
+        names = {}
+    op, *operands = instr
+    target = _targets.get(op)
+    cmd = []
+    for i, x in enumerate(operands):
+        if x is None:
+            continue
+        if i == target:
+            cmd.append(x)
+        elif op is prstr:
+            cmd.append(repr(consts[x]))
+        elif op is bltin and i == 2:
+            cmd.append(x.__name__)
+        else:
+            cmd.append(names.get(x, f'r{x}'))
+    print(line, '\t', op.__name__, *cmd)
+
+# list the program, registers shown by variable name or constant value
+def dump(rc: RegCode):
+    names = {reg: '%.12g' % val for reg, val in enumerate(rc.regs)
+             if val is not None}
+    names.update((reg, sym.name) for reg, sym in rc.syms)
+    for line, instr in enumerate(rc.code):
+        pprint(line, instr, names)
@@ -0,0 +1,115 @@
+# Ejecucion en paralelo
+#
+# Reparte trabajo de la maquina de pila entre procesos con
+# concurrent.futures:
+#
+#   run_files(paths)            un programa por archivo; cada proceso lo
+#                               compila (o lo toma del cache de cache.py)
+#   run_batch(source, records)  un solo programa sobre muchos registros; se
+#                               compila una vez aqui y los procesos reciben
+#                               el bytecode (.mcc) al arrancar
+#
+# La salida de cada trabajo se captura en el proceso que lo ejecuta y se
+# devuelve en el mismo orden de la entrada.
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from errors import errors_detected
+from init import constpool, symlist
+from vm import Machine, execute
+
+import batch
+import bytecode
+import cache
+import contextlib
+import io
+import itertools
+import os
+import sys
+
+CHUNK = 1000    # records per task in run_batch
+
+# generate the program for source in the default machine
+def compile_source(source, optimize=True, inputs=()):
+    from minic import Lexer, Parser
+    from optimizer import ConstantFolder
+    constpool.clear()
+    batch.declare(inputs)
+    top = Parser().parse(Lexer().tokenize(source))
+    if optimize:
+        top = ConstantFolder.optimize(top)
+    return batch.BatchProgram.generate(top, inputs, optimize)
+
+def _run_file(path, optimize):
+    out = io.StringIO()
+    # the worker may have run other files: none of their variables,
+    # functions or constants are visible to this one
+    symlist.clear()
+    constpool.clear()
+    try:
+        with open(path) as f:
+            source = f.read()
+        with contextlib.redirect_stdout(out):
+            key = cache.key(source, optimize)
+            if not cache.load(key):
+                before = errors_detected()
+                compile_source(source, optimize)
+                if errors_detected() == before:
+                    cache.store(key)
+            execute()
+    except Exception as e:
+        # one failing file is reported with its output, the rest still run
+        return path, out.getvalue(), f'{type(e).__name__}: {e}'
+    return path, out.getvalue(), None
+
+def run_files(paths, jobs=None, optimize=True):
+    '''
+    Ejecuta cada archivo en un proceso del pool. Genera (path, salida,
+    error o None) en el orden de paths.
+    '''
+    paths = list(paths)
+    with ProcessPoolExecutor(jobs) as pool:
+        yield from pool.map(_run_file, paths, itertools.repeat(optimize))
+
+# program of each worker process in run_batch
+_program = None
+
+def _init_batch(buf, inputs):
+    global _program
+    _program = batch.BatchProgram(inputs, bytecode.loads(buf, Machine()))
+
+def _run_chunk(records):
+    out = io.StringIO()
+    _program.run_all(records, out)
+    return out.getvalue()
+
+def run_batch(source, records, inputs, jobs=None, optimize=True, out=None):
+    '''
+    Como batch.BatchProgram.run_all, pero repartiendo los registros en
+    bloques de CHUNK entre los procesos del pool.
+    '''
+    program = compile_source(source, optimize, inputs)
+    return run_program(program, records, jobs, out)
+
+def run_program(program, records, jobs=None, out=None):
+    if out is None:
+        out = sys.stdout
+    jobs = jobs or os.cpu_count()
+    buf = bytecode.dumps(program.machine)
+    records = iter(records)
+    chunks = iter(lambda: list(itertools.islice(records, CHUNK)), [])
+    with ProcessPoolExecutor(jobs, initializer=_init_batch,
+                             initargs=(buf, list(program.inputs))) as pool:
+        # a few chunks in flight per process, not the whole input
+        window = 2 * jobs
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_run_chunk, chunk))
+            if len(pending) >= window:
+                out.write(pending.popleft().result())
+        while pending:
+            out.write(pending.popleft().result())
+
+# .mc files of a directory, sorted by name
+def sources(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith('.mc'))
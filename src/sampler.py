@@ -0,0 +1,77 @@
+# Perfilador por muestreo (--sample)
+#
+# Un temporizador de CPU (setitimer + SIGPROF) interrumpe el programa cada
+# `interval` segundos y el manejador solo anota el pc de la maquina. Al
+# terminar, la tabla pc -> linea de la maquina convierte las muestras en
+# lineas del fuente, y los saltos hacia atras de `prog` (el jmp al final
+# de cada while) delimitan los bucles. El costo es un manejador por
+# muestra, no por instruccion.
+from collections import Counter
+from errors import CompilerError
+from vm import _jump_instr, _noperands
+
+import signal
+import sys
+
+class Sampler:
+
+    def __init__(self, m, interval=0.001):
+        if not hasattr(signal, 'setitimer'):
+            raise CompilerError('--sample necesita signal.setitimer (Unix)')
+        self.m = m
+        self.interval = interval
+        self.samples = Counter()    # pc -> samples
+        self.previous = None
+
+    def handler(self, signum, frame):
+        self.samples[self.m.pc - 1] += 1
+
+    def __enter__(self):
+        self.previous = signal.signal(signal.SIGPROF, self.handler)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return self
+
+    def __exit__(self, *exc):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+
+    def lines(self):
+        lines = Counter()
+        for pc, n in self.samples.items():
+            lines[self.m.lines.lookup(pc)] += n
+        return lines
+
+    # (first line, last line, samples) of each while loop
+    def loops(self):
+        m = self.m
+        loops = []
+        addr = 0
+        while addr < len(m.prog):
+            instr = m.prog[addr]
+            n = _noperands.get(instr, 0)
+            if instr in _jump_instr and m.prog[addr+1] <= addr:
+                top, end = m.prog[addr+1], addr + n
+                spanned = [m.lines.lookup(top)]
+                spanned += [line for pc, line in m.lines if top <= pc <= end]
+                count = sum(c for pc, c in self.samples.items() if top <= pc <= end)
+                loops.append((min(spanned), max(spanned), count))
+            addr += 1 + n
+        return loops
+
+    def report(self, source=None, top=10, file=None):
+        if file is None:
+            file = sys.stderr
+        total = sum(self.samples.values())
+        print(f'\nmuestras: {total}, una cada {self.interval * 1e3:g} ms de CPU', file=file)
+        if not total:
+            return
+        text = source.splitlines() if source else []
+        print(f'{"%":>6} {"muestras":>9} {"linea":>6}', file=file)
+        for line, n in self.lines().most_common(top):
+            src = text[line-1].strip() if 0 < line <= len(text) else ''
+            print(f'{100 * n / total:>6.1f} {n:>9} {line or "?":>6}  {src}', file=file)
+        loops = sorted(self.loops(), key=lambda loop: -loop[2])
+        if loops:
+            print(f'\n{"%":>6} {"muestras":>9} bucle', file=file)
+            for first, last, n in loops[:top]:
+                print(f'{100 * n / total:>6.1f} {n:>9} lineas {first}-{last}', file=file)
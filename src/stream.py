@@ -0,0 +1,91 @@
+# Compilacion por flujo para la maquina de pila
+#
+# Para fuentes muy grandes (generados por programas) run_compiler no lee el
+# archivo entero ni construye el AST completo:
+#
+#   - el archivo se mapea con mmap y el lexer recibe trozos de CHUNK bytes
+#     cortados en un fin de linea (ningun token de MiniC cruza una linea,
+#     salvo los comentarios /* */, que se dejan enteros en un trozo)
+#   - los tokens fluyen de a uno hacia el parser
+#   - cada sentencia de primer nivel se pliega, se genera y pasa por el
+#     peephole en cuanto Parser.list la reduce, y despues se descarta
+#
+# La memoria maxima depende de la sentencia mas grande y del codigo
+# generado, no del tamaño del fuente. El plegado por sentencia es igual de
+# correcto que el del programa entero: una constante (PI, E, ...) asignada
+# en una sentencia posterior todavia no cambio cuando se ejecuta esta.
+from contextlib import contextmanager
+from irgenerator import CodeGenerator
+from optimizer import ConstantFolder, assigned_names
+
+import mmap
+import os
+import peephole
+
+CHUNK = 1 << 20     # bytes of source decoded and lexed at a time
+
+# read-only mmap of the file at path (b'' if it is empty: nothing to map)
+@contextmanager
+def open_source(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield buf
+
+# (start, end) of the next chunk: at least size bytes, up to a newline,
+# and past the end of a /* comment still open there
+def _chunk_end(buf, start, size):
+    n = len(buf)
+    end = start + size
+    while end < n:
+        nl = buf.find(b'\n', end - 1)
+        end = n if nl < 0 else nl + 1
+        opening = buf.rfind(b'/*', start, end)
+        if opening < 0 or buf.find(b'*/', opening + 2, end) >= 0:
+            break
+        closing = buf.find(b'*/', end)
+        end = n if closing < 0 else closing + 2
+    return min(end, n)
+
+# (start, end) byte ranges of the chunks of buf from start on
+def spans(buf, size=CHUNK, start=0):
+    while start < len(buf):
+        end = _chunk_end(buf, start, size)
+        yield start, end
+        start = end
+
+def chunks(buf, size=CHUNK):
+    for start, end in spans(buf, size):
+        yield buf[start:end].decode('utf-8')
+
+# tokens of the whole buffer, lexed chunk by chunk
+def tokenize(lexer, buf, size=CHUNK):
+    lineno = 1
+    for text in chunks(buf, size):
+        yield from lexer.tokenize(text, lineno)
+        lineno = lexer.lineno
+
+def compile(buf, optimize=True, m=None, symtab=None, pool=None):
+    '''
+    Genera en la maquina m (por omision la global) el programa del fuente
+    buf, una sentencia de primer nivel a la vez.
+    '''
+    from minic import Lexer, Parser
+    generator = CodeGenerator(m)
+    folder = ConstantFolder(set(), pool) if optimize else None
+
+    def emit(stmt):
+        if folder is None:
+            generator.statement(stmt)
+            return
+        start = len(generator.prog)
+        assigned_names(stmt, folder.assigned)
+        for stmt in folder.visit([stmt]):
+            generator.statement(stmt)
+        peephole.optimize(generator.prog, generator.m.lines, start)
+
+    generator.m.initcode()
+    Parser(emit).parse(tokenize(Lexer(symtab, pool), buf))
+    generator.finish()
@@ -0,0 +1,72 @@
+# Los cuatro backends tienen que imprimir lo mismo para cada programa.
+import contextlib
+import io
+import math
+
+import pytest
+
+from init import constpool, predefined
+from irgenerator import CodeGenerator, RegisterGenerator
+from minic import Lexer, Parser
+from model import SymbolTable
+from optimizer import ConstantFolder
+from vm import machine
+
+import peephole
+
+BACKENDS = ('stack', 'register', 'closure', 'python')
+
+PROGRAMS = {
+    'mod':      'print -1 % 3, " ", 7 % -2, " ", -7.5 % 2',
+    'modeq':    'x = -1\nx %= 3\ny = 7\ny %= -2\nz = -7.5\nz %= 2\nprint x, " ", y, " ", z',
+    'opeq':     'x = 5\nx += 2\nx -= 1\nx *= 3\nx /= 4\nprint x',
+    'opeqinc':  'a = 1\na += a++\nb = 5\nb *= b--\nc = 7\nc -= c++\nd = 8\nd /= d--\n'
+                'e = 7\ne %= e--\nprint a, " ", b, " ", c, " ", d, " ", e',
+    'while':    'i = 0\ns = 0\nwhile (i < 10) { s += i i++ }\nprint s',
+    'if':       'x = 3\nif (x > 2 && x != 4) { print "si" } else { print "no" }',
+    'builtins': 'print int(-2.5), " ", abs(-3), " ", sqrt(16)',
+    'negpow':   'y = 2\nprint (-1)^y, " ", (-2)^3, " ", -2^2, " ", 2^-1',
+}
+
+def run(source, backend, optimize=True):
+    constpool.clear()
+    top = Parser().parse(Lexer(SymbolTable(predefined)).tokenize(source))
+    if optimize:
+        top = ConstantFolder.optimize(top)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        if backend == 'register':
+            import regvm
+            regvm.run(RegisterGenerator.generate(top))
+        elif backend == 'closure':
+            import closures
+            closures.ClosureGenerator.generate(top)()
+        elif backend == 'python':
+            import pygenerator
+            pygenerator.run(pygenerator.PythonGenerator.generate(top))
+        else:
+            machine.initcode()
+            CodeGenerator.generate(top)
+            if optimize:
+                peephole.optimize()
+            machine.execute()
+    return out.getvalue()
+
+@pytest.mark.parametrize('optimize', (True, False))
+@pytest.mark.parametrize('name', sorted(PROGRAMS))
+def test_backends_agree(name, optimize):
+    outputs = {backend: run(PROGRAMS[name], backend, optimize) for backend in BACKENDS}
+    assert len(set(outputs.values())) == 1, outputs
+
+def test_modeq_is_fmod():
+    assert run('x = -1\nx %= 3\nprint x', 'stack') == run('print -1 % 3', 'stack') == '-1 '
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_predefined_is_not_changed(backend):
+    assert run('PI = 3\nPI += 1\nprint PI', backend, False) == '4 '
+    assert predefined.lookup('PI').val == math.pi
+    assert run('print PI', backend, False) == '%.12g ' % math.pi
+
+def test_negative_zero_is_its_own_constant():
+    source = 'print 0, " ", -0'
+    assert run(source, 'stack') == run(source, 'stack', False) == '0  -0 '
@@ -0,0 +1,42 @@
+# Un programa guardado en .mcc y vuelto a cargar hace lo mismo.
+import io
+
+import pytest
+
+from errors import CompilerError
+from interpreter import Interpreter
+from vm import Machine
+
+import bytecode
+
+SOURCE = '''x = -0
+s = 0
+i = 0
+while (i < 5) { s += sqrt(i) i++ }
+print "a\\nb\\\\n", x, " ", s, " ", PI
+'''
+
+def output(m):
+    m.out = io.StringIO()
+    m.execute()
+    return m.out.getvalue()
+
+def test_round_trip():
+    interp = Interpreter.from_source(SOURCE)
+    buf = bytecode.dumps(interp.machine)
+    m = bytecode.loads(buf, Machine())
+    assert bytecode.dumps(m) == buf
+    assert output(m) == output(interp.machine)
+    assert [sym.name for sym in m.symbols] == [sym.name for sym in interp.machine.symbols]
+    assert list(m.lines) == list(interp.machine.lines)
+
+def test_save_and_load_file(tmp_path):
+    interp = Interpreter.from_source(SOURCE)
+    path = tmp_path / 'prog.mcc'
+    bytecode.save(path, interp.machine)
+    assert bytecode.is_bytecode(path)
+    assert output(bytecode.load_file(path, Machine())) == output(interp.machine)
+
+def test_not_bytecode():
+    with pytest.raises(CompilerError):
+        bytecode.loads(b'print 1', Machine())
@@ -0,0 +1,89 @@
+# Cache de compilacion: un acierto salta la compilacion y da el mismo
+# resultado; un cambio en el fuente o en el compilador es un fallo; las
+# entradas viejas se desalojan primero; y lo que dio avisos no se guarda.
+import argparse
+import os
+
+import pytest
+
+from init import constpool, symlist
+from minic import run_streamed
+
+import cache
+import stream
+
+def args(path, **options):
+    defaults = dict(input=str(path), cache=True, output=None, optimize=True,
+                    incremental=False, sample=None, profile=False)
+    defaults.update(options)
+    return argparse.Namespace(**defaults)
+
+@pytest.fixture(autouse=True)
+def fresh_symbols():
+    symlist.clear()
+    constpool.clear()
+    yield
+    symlist.clear()
+
+def entries(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.endswith('.mcc'))
+
+def run(path, capsys):
+    symlist.clear()
+    constpool.clear()
+    run_streamed(args(path))
+    return capsys.readouterr().out
+
+def no_compile(*args, **kwargs):
+    raise AssertionError('recompilo un programa que estaba en el cache')
+
+def test_large_program_is_stored_and_loaded(tmp_path, cache_dir, capsys, monkeypatch):
+    path = tmp_path / 'big.mc'
+    path.write_text('x = 0\n' + ''.join(f'x = x + {i}\n' for i in range(3000)) + 'print x\n')
+    first = run(path, capsys)
+    assert len(entries(cache_dir)) == 1
+    monkeypatch.setattr(stream, 'compile', no_compile)
+    assert run(path, capsys) == first
+
+def test_changed_source_is_a_miss(tmp_path, cache_dir, capsys):
+    path = tmp_path / 'a.mc'
+    path.write_text('x = 2\nprint x\n')
+    assert run(path, capsys).endswith('2 ')
+    path.write_text('x = 3\nprint x\n')
+    assert run(path, capsys).endswith('3 ')
+    assert len(entries(cache_dir)) == 2
+
+def test_other_compiler_is_a_miss(tmp_path, capsys, monkeypatch):
+    path = tmp_path / 'a.mc'
+    path.write_text('print 1\n')
+    key = cache.key(path.read_bytes(), True)
+    monkeypatch.setattr(cache, '_version', 'otro compilador')
+    assert cache.key(path.read_bytes(), True) != key
+
+def test_diagnostics_are_not_stored(tmp_path, cache_dir, capsys):
+    path = tmp_path / 'a.mc'
+    path.write_text('print zz, "\\n"\n')
+    for _ in range(2):
+        assert "variable no definida 'zz'" in run(path, capsys)
+    assert entries(cache_dir) == []
+
+def test_corrupt_entry_is_a_miss(tmp_path, cache_dir, capsys):
+    path = tmp_path / 'a.mc'
+    path.write_text('x = 5\nprint x\n')
+    run(path, capsys)
+    entry, = entries(cache_dir)
+    with open(os.path.join(cache_dir, entry), 'wb') as f:
+        f.write(b'MNCC\x02\x00 basura')
+    assert run(path, capsys).endswith('5 ')
+
+def test_evicts_least_recently_used(cache_dir):
+    os.makedirs(cache_dir)
+    for i, name in enumerate(('viejo', 'medio', 'nuevo')):
+        p = os.path.join(cache_dir, name + '.mcc')
+        with open(p, 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(p, (1000 + i, 1000 + i))
+    cache.evict(limit=250)
+    assert entries(cache_dir) == ['medio.mcc', 'nuevo.mcc']
@@ -0,0 +1,154 @@
+# Recompilacion incremental: despues de editar, insertar o borrar
+# sentencias, el programa reutilizando el indice anterior tiene que ser
+# igual al de compilar todo de nuevo (codigo, tabla de lineas y avisos).
+import contextlib
+import io
+import json
+import random
+
+import pytest
+
+from init import predefined
+from model import ConstPool, SymbolTable
+from vm import Machine, _const_instr, _noperands, _slot_instr, bltin
+
+import incremental
+import stream
+
+STATEMENTS = [
+    'x{i} = {i} * 2 + y',
+    'print x{i}, "a", {i}',
+    'while (x{i} < {i}) {{ x{i} += 1 y++ }}',
+    'if (x{i} > {i}) {{ z = sqrt({i}) }} else {{ z = PI }}',
+    'PI = {i}',
+    'y = x{i} % 3 /* comentario */',
+    'w = w + 1 // avisa: w no definida',
+]
+
+def program(n, seed=0):
+    rnd = random.Random(seed)
+    return ['y = 1'] + [rnd.choice(STATEMENTS).format(i=rnd.randrange(20)) for _ in range(n)]
+
+def source(lines):
+    return ('\n'.join(lines) + '\n').encode()
+
+def listing(m, pool):
+    code = []
+    pc = 0
+    while pc < len(m.prog):
+        instr = m.prog[pc]
+        n = _noperands.get(instr, 0)
+        operands = []
+        for operand in m.prog[pc+1:pc+1+n]:
+            if instr in _slot_instr:
+                operand = m.symbols[operand].name
+            elif instr in _const_instr:
+                c = pool[operand]
+                operand = c.str if c.type == 'STRING' else c.val
+            elif instr is bltin:
+                operand = operand.name
+            operands.append(operand)
+        code.append((getattr(instr, '__name__', instr), *operands))
+        pc += 1 + n
+    return code, list(zip(m.lines.pcs, m.lines.lines))
+
+def compile_with(compile, buf):
+    pool = ConstPool()
+    m = Machine(consts=pool.values)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        result = compile(buf, m, SymbolTable(predefined), pool)
+    return listing(m, pool), out.getvalue(), result
+
+def full(buf):
+    return compile_with(lambda buf, m, symtab, pool:
+        stream.compile(buf, True, m, symtab, pool), buf)[:2]
+
+def incremental_compile(buf, old=()):
+    return compile_with(lambda buf, m, symtab, pool:
+        incremental.Compilation(buf, old, True, m, symtab, pool).compile(), buf)
+
+# units of buf after a round trip through the index file
+def index(buf, tmp_path):
+    path = str(tmp_path / 'a.units')
+    incremental.save_index(path, incremental_compile(buf)[2].units)
+    return incremental.load_index(path)
+
+def check(before, after, tmp_path):
+    code, out, c = incremental_compile(source(after), index(source(before), tmp_path))
+    assert (code, out) == full(source(after))
+    return c
+
+def test_unchanged(tmp_path):
+    lines = program(40)
+    c = check(lines, lines, tmp_path)
+    assert c.reused > 0
+
+def test_edit_middle(tmp_path):
+    before = program(40)
+    after = before[:20] + ['x3 = 99'] + before[21:]
+    c = check(before, after, tmp_path)
+    assert c.reused > 0
+
+def test_insert_middle(tmp_path):
+    before = program(40)
+    after = before[:20] + ['print "nueva"', 'if (y) { y = 2 }'] + before[20:]
+    c = check(before, after, tmp_path)
+    assert c.reused > 0
+
+def test_delete_middle(tmp_path):
+    before = program(40)
+    after = before[:15] + before[25:]
+    c = check(before, after, tmp_path)
+    assert c.reused > 0
+
+def test_join_lines(tmp_path):
+    # the edit makes the previous statement continue into the next one
+    before = ['y = 1', 'x = y', '-2', 'print x']
+    after = ['y = 1', 'x = y', '- 2', 'print x']
+    check(before, after, tmp_path)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_edits(seed, tmp_path):
+    rnd = random.Random(seed)
+    before = program(30, seed)
+    for _ in range(10):
+        after = list(before)
+        i = rnd.randrange(len(after) + 1)
+        op = rnd.choice(('edit', 'insert', 'delete'))
+        if op == 'insert' or not after:
+            after.insert(i, rnd.choice(STATEMENTS).format(i=rnd.randrange(20)))
+        elif op == 'delete':
+            del after[min(i, len(after) - 1)]
+        else:
+            after[min(i, len(after) - 1)] = rnd.choice(STATEMENTS).format(i=rnd.randrange(20))
+        check(before, after, tmp_path)
+        before = after
+
+def test_bad_index(tmp_path):
+    path = tmp_path / 'a.units'
+    for text in ('', 'no es json', '[]', '{"version": 2}',
+                 json.dumps({'version': incremental.VERSION, 'compiler': 'otro', 'units': []})):
+        path.write_text(text)
+        assert incremental.load_index(str(path)) == []
+
+def test_index_cannot_name_other_functions(tmp_path):
+    buf = source(['x = 1', 'print x'])
+    path = str(tmp_path / 'a.units')
+    incremental.save_index(path, incremental_compile(buf)[2].units)
+    with open(path) as f:
+        data = json.load(f)
+    data['units'][0]['cells'][0] = 'initcode'
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    assert incremental.load_index(path) == []
+
+def test_large_file_reuses_every_unit(tmp_path):
+    lines = ['x = 0'] + [f'x = x + {i}' for i in range(3000)] + ['print x']
+    code, _, c = incremental_compile(source(lines), index(source(lines), tmp_path))
+    assert len(code[0]) > 2000
+    assert c.reused == len(c.units) == len(lines)
+    # and an edit in the middle still recompiles only around it
+    lines[1500] = 'x = x - 1'
+    c = check(lines[:1500] + ['x = x + 1499'] + lines[1501:], lines, tmp_path)
+    assert c.reused >= len(lines) - 2
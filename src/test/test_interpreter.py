@@ -0,0 +1,44 @@
+# Cada Interpreter escribe su salida, y sus mensajes de error, en su `out`.
+import asyncio
+import io
+
+import pytest
+
+from interpreter import Interpreter
+
+def test_runtime_error_goes_to_out(capsys):
+    out = io.StringIO()
+    interp = Interpreter.from_source('x = 0\nprint 1 / x', out=out)
+    with pytest.raises(ZeroDivisionError):
+        interp.run()
+    assert 'division por cero' in out.getvalue()
+    assert interp.errors == 1
+    assert capsys.readouterr().out == ''
+
+def test_compile_error_goes_to_out(capsys):
+    out = io.StringIO()
+    interp = Interpreter.from_source('x = 1 @ 2', out=out)
+    assert out.getvalue()
+    assert interp.errors > 0
+    assert capsys.readouterr().out == ''
+
+def test_async_interpreters_keep_their_output():
+    outs = [io.StringIO(), io.StringIO()]
+    interps = [Interpreter.from_source(source, out=out)
+               for source, out in zip(('print 1', 'x = 0\nprint 2 / x'), outs)]
+
+    async def main():
+        await asyncio.gather(*(interp.run_async() for interp in interps),
+                             return_exceptions=True)
+
+    asyncio.run(main())
+    assert outs[0].getvalue() == '1 '
+    assert 'division por cero' in outs[1].getvalue()
+
+def test_assigning_a_constant_is_private():
+    first = Interpreter.from_source('PI = 3\nprint PI', out=io.StringIO())
+    second = Interpreter.from_source('print PI', out=io.StringIO())
+    first.run()
+    second.run()
+    assert first.machine.out.getvalue() == '3 '
+    assert second.machine.out.getvalue() == '3.14159265359 '
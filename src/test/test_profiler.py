@@ -0,0 +1,45 @@
+# --profile cuenta cada instruccion y cada variable o builtin que toca,
+# sin cambiar lo que hace el programa.
+import io
+
+import pytest
+
+from interpreter import Interpreter
+from vm import jz, lt
+
+import profiler
+
+SOURCE = 'i = 0\ns = 0\nwhile (i < 3) { s += sqrt(i) i++ }\nprint s'
+
+def compile(source=SOURCE):
+    return Interpreter.from_source(source, out=io.StringIO(), optimize=False)
+
+def test_same_output_as_execute():
+    plain, profiled = compile(), compile()
+    plain.run()
+    profiler.execute(profiled.machine)
+    assert profiled.machine.out.getvalue() == plain.machine.out.getvalue()
+    assert profiled.variables() == plain.variables()
+
+def test_counts():
+    prof = profiler.execute(compile().machine)
+    assert prof.counts[lt] == 4
+    assert prof.counts[jz] == 4
+    assert prof.scounts['sqrt()'] == 3
+    assert prof.scounts['s'] == 5
+    assert set(prof.times) == set(prof.counts)
+    assert prof.total >= sum(prof.times.values())
+
+def test_profile_kept_when_it_raises():
+    prof = profiler.Profile()
+    with pytest.raises(ZeroDivisionError):
+        profiler.execute(compile('x = 0\ny = 1\nprint y / x').machine, prof=prof)
+    assert prof.scounts['x'] == 2
+    assert prof.total > 0
+
+def test_report():
+    out = io.StringIO()
+    profiler.report(profiler.execute(compile().machine), out)
+    report = out.getvalue()
+    assert 'perfil: 45 instrucciones' in report
+    assert 'sqrt()' in report and 'bltin' in report
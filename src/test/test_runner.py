@@ -0,0 +1,28 @@
+# minic.py sobre un directorio ejecuta cada .mc y falla si falla alguno.
+import os
+import subprocess
+import sys
+
+MINIC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'minic.py')
+
+def minic(cache_dir, *args):
+    env = dict(os.environ, MINIC_CACHE_DIR=str(cache_dir))
+    return subprocess.run([sys.executable, MINIC, *args], capture_output=True, text=True,
+                          env=env)
+
+def test_directory_runs_every_file(tmp_path, cache_dir):
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'a.mc').write_text('print 1')
+    (tmp_path / 'src' / 'b.mc').write_text('print 2')
+    result = minic(cache_dir, str(tmp_path / 'src'), '--jobs', '2')
+    assert result.returncode == 0, result.stderr
+    assert '1 ' in result.stdout and '2 ' in result.stdout
+
+def test_directory_fails_if_a_file_fails(tmp_path, cache_dir):
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'a.mc').write_text('print 1')
+    (tmp_path / 'src' / 'b.mc').write_text('x = 0\nprint 1 / x')
+    result = minic(cache_dir, str(tmp_path / 'src'), '--jobs', '2')
+    assert result.returncode == 1
+    assert 'b.mc' in result.stderr
+    assert '1 ' in result.stdout
@@ -0,0 +1,48 @@
+# La tabla pc -> linea de la maquina: errores en tiempo de ejecucion con
+# su linea, y el perfilador por muestreo (--sample).
+import io
+
+import pytest
+
+from interpreter import Interpreter
+from vm import LineTable
+
+import sampler
+
+LOOP = 'x = 0\ni = 0\nwhile (i < 3) {\n  i++\n}\ny = 1\nprint y / x\n'
+
+def test_line_table_lookup():
+    lines = LineTable()
+    for pc, line in ((0, 1), (4, 2), (8, 2), (9, 5)):
+        lines.add(pc, line)
+    assert list(lines) == [(0, 1), (4, 2), (9, 5)]
+    assert [lines.lookup(pc) for pc in (0, 3, 4, 8, 9, 20)] == [1, 1, 2, 2, 5, 5]
+
+@pytest.mark.parametrize('optimize', (True, False))
+def test_runtime_error_has_its_line(optimize):
+    out = io.StringIO()
+    interp = Interpreter.from_source(LOOP, out=out, optimize=optimize)
+    with pytest.raises(ZeroDivisionError):
+        interp.run()
+    assert out.getvalue() == '7: division por cero\n'
+
+def test_samples_to_lines_and_loops():
+    m = Interpreter.from_source(LOOP, optimize=False).machine
+    s = sampler.Sampler(m)
+    # pc of each line: one sample on line 1, three in the loop body
+    pcs = {line: pc for pc, line in m.lines}
+    s.samples[pcs[1]] += 1
+    s.samples[pcs[4]] += 3
+    assert s.lines() == {1: 1, 4: 3}
+    assert s.loops() == [(3, 4, 3)]
+
+def test_sampling_a_run():
+    m = Interpreter.from_source('i = 0\nwhile (i < 300000) {\n  i++\n}\n').machine
+    s = sampler.Sampler(m, 0.0005)
+    with s:
+        m.execute()
+    assert sum(s.samples.values()) > 0
+    assert set(s.lines()) <= {1, 2, 3, 4}
+    out = io.StringIO()
+    s.report('i = 0\nwhile (i < 300000) {\n  i++\n}\n', file=out)
+    assert 'muestras:' in out.getvalue() and 'lineas 2-3' in out.getvalue()
@@ -0,0 +1,87 @@
+# Compilacion por flujo: el programa generado sentencia por sentencia
+# desde el mmap tiene que ser el mismo que el del AST completo, sin
+# importar donde caen los cortes de los trozos, y sin limite de tamaño.
+import argparse
+
+import pytest
+
+from errors import CompilerError
+from init import constpool, predefined, symlist
+from irgenerator import CodeGenerator
+from minic import Lexer, Parser, run_streamed
+from model import ConstPool, SymbolTable
+from optimizer import ConstantFolder
+from vm import Machine, machine
+
+import peephole
+import stream
+
+SOURCE = b'''x = 1 /* un comentario
+que cruza lineas */ y = 2
+while (x < 10) { x = x * 2 y++ }
+if (x > y) { print "mayor", x } else { print y }
+PI = 3
+z = PI * 2 // otro comentario
+print z, "\\n"
+'''
+
+def args(path, **options):
+    defaults = dict(input=str(path), cache=False, output=None, optimize=True,
+                    incremental=False, sample=None, profile=False)
+    defaults.update(options)
+    return argparse.Namespace(**defaults)
+
+def big(n):
+    lines = ['x = 0'] + [f'x = x + {i} * 2 - 1' for i in range(n)] + ['print x, "\\n"']
+    return '\n'.join(lines) + '\n'
+
+@pytest.fixture(autouse=True)
+def fresh_symbols():
+    symlist.clear()
+    constpool.clear()
+    yield
+    symlist.clear()
+
+def listing(m):
+    return [getattr(c, '__name__', c) if callable(c) else c for c in m.prog]
+
+def tokens(lexer_tokens):
+    return [(tok.type, getattr(tok.value, 'name', getattr(tok.value, 'val', tok.value)),
+             tok.lineno) for tok in lexer_tokens]
+
+@pytest.mark.parametrize('size', (1, 2, 7, 20, 200, stream.CHUNK))
+def test_chunks_do_not_change_tokens(size):
+    whole = tokens(Lexer(SymbolTable(predefined), ConstPool()).tokenize(SOURCE.decode()))
+    chunked = tokens(stream.tokenize(Lexer(SymbolTable(predefined), ConstPool()), SOURCE, size))
+    assert chunked == whole
+
+@pytest.mark.parametrize('optimize', (True, False))
+def test_same_code_as_whole_program(optimize):
+    pool = ConstPool()
+    whole = Machine(consts=pool.values)
+    top = Parser().parse(Lexer(SymbolTable(predefined), pool).tokenize(SOURCE.decode()))
+    if optimize:
+        top = ConstantFolder.optimize(top, pool)
+    CodeGenerator.generate(top, whole)
+    if optimize:
+        peephole.optimize(whole.prog, whole.lines)
+
+    streamed = Machine(consts=pool.values)
+    stream.compile(SOURCE, optimize, streamed, SymbolTable(predefined), pool)
+    assert listing(streamed) == listing(whole)
+    assert list(streamed.lines) == list(whole.lines)
+
+def test_large_program(tmp_path, capsys):
+    path = tmp_path / 'big.mc'
+    path.write_text(big(3000))
+    run_streamed(args(path))
+    out = capsys.readouterr().out
+    assert len(machine.prog) > 2000
+    assert 'programa muy grande' not in out
+    assert out.endswith(f'{sum(i * 2 - 1 for i in range(3000)):.12g} \n')
+
+def test_size_limit_is_one_error():
+    m = Machine(consts=constpool.values, nprog=100)
+    with pytest.raises(CompilerError, match='programa muy grande'):
+        stream.compile(big(100).encode(), True, m)
+    assert len(m.prog) == 100
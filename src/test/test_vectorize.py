@@ -0,0 +1,65 @@
+# La evaluacion sobre columnas tiene que dar lo mismo que la VM escalar,
+# o dejar que la VM escalar reporte el error.
+import contextlib
+import io
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from init import constpool, symlist
+
+import batch
+import runner
+import vectorize
+
+def scalar(source, records):
+    program = runner.compile_source(source, True, list(records[0]))
+    out = io.StringIO()
+    try:
+        program.run_all(records, out)
+    except Exception as e:
+        return type(e)
+    return out.getvalue()
+
+def vectorized(source, records):
+    from minic import Lexer, Parser
+    from optimizer import ConstantFolder
+    constpool.clear()
+    inputs = list(records[0])
+    batch.declare(inputs)
+    top = ConstantFolder.optimize(Parser().parse(Lexer().tokenize(source)))
+    program = batch.BatchProgram.generate(top, inputs)
+    assert vectorize.eligible(top)
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            vectorize.run_all(top, program, records, out)
+    except Exception as e:
+        return type(e)
+    return out.getvalue()
+
+@pytest.fixture(autouse=True)
+def fresh_symbols():
+    symlist.clear()
+    yield
+    symlist.clear()
+
+VALUES = ['1.5', '-2', '0', 'inf', '-inf', 'nan', '1e308']
+
+@pytest.mark.parametrize('builtin', sorted(vectorize._ufuncs))
+@pytest.mark.parametrize('value', VALUES)
+def test_builtin(builtin, value):
+    source = f'print {builtin}(x)'
+    records = [{'x': '0.5'}, {'x': value}]
+    assert vectorized(source, records) == scalar(source, records)
+
+def test_int_of_inf_falls_back():
+    records = [{'x': 'inf'}]
+    assert scalar('print int(x)', records) is OverflowError
+    assert vectorized('print int(x)', records) is OverflowError
+
+def test_if_and_assignments():
+    source = 'y = x * 2\nif (y > 3) { y %= 4 } else { y -= 1 }\nprint y, " ", int(x)'
+    records = [{'x': str(v)} for v in (-3.5, -1, 0, 1, 2.5, 7)]
+    assert vectorized(source, records) == scalar(source, records)
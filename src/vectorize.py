@@ -0,0 +1,275 @@
+# Evaluacion vectorizada con NumPy
+#
+# Para el modo por lotes: si el programa no tiene bucles, en vez de
+# ejecutar la VM una vez por registro se evalua el AST una sola vez sobre
+# columnas de NumPy con todos los registros de un bloque. Cada variable es
+# un array, Binop/Bltin son ufuncs y los if se resuelven con mascaras
+# (una asignacion dentro de un if solo cambia las filas donde la condicion
+# es verdadera).
+#
+# Si NumPy no esta instalado, el programa no es elegible, o algun registro
+# produciria un error en la VM (division por cero, sqrt(-1), ...), el
+# bloque se ejecuta con la VM escalar de batch.BatchProgram, que es la que
+# reporta el error.
+from errors import CompilerError
+from init import constpool
+from model import *
+
+import itertools
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHUNK = 65536   # records evaluated together
+
+_ufuncs = {
+    'sin'   : 'sin',
+    'cos'   : 'cos',
+    'atan'  : 'arctan',
+    'asin'  : 'arcsin',
+    'acos'  : 'arccos',
+    'sinh'  : 'sinh',
+    'cosh'  : 'cosh',
+    'tanh'  : 'tanh',
+    'log'   : 'log',
+    'log10' : 'log10',
+    'exp'   : 'exp',
+    'sqrt'  : 'sqrt',
+    'int'   : 'trunc',
+    'abs'   : 'fabs',
+}
+
+_relop = {
+    '<'  : 'less',
+    '<=' : 'less_equal',
+    '>'  : 'greater',
+    '>=' : 'greater_equal',
+    '==' : 'equal',
+    '!=' : 'not_equal',
+}
+
+_arith = {
+    '+' : 'add',
+    '-' : 'subtract',
+    '*' : 'multiply',
+}
+
+# some record would fail in the scalar VM
+class Fallback(Exception):
+    pass
+
+# non-finite arguments on which the builtin of sym raises in the scalar VM
+def _rejected(sym):
+    rejected = []
+    for x in (float('inf'), float('-inf'), float('nan')):
+        try:
+            sym.ptr(x)
+        except (ArithmeticError, ValueError):
+            rejected.append(x)
+    return rejected
+
+# True if every node of the tree can be evaluated over columns
+def eligible(node):
+    if isinstance(node, list):
+        return all(eligible(n) for n in node)
+    if isinstance(node, (While, Function, Procedure)):
+        return False
+    if isinstance(node, Bltin) and node.sym.name not in _ufuncs:
+        return False
+    if isinstance(node, Node):
+        return all(eligible(getattr(node, name)) for name in node.__dataclass_fields__)
+    return True
+
+class VectorEvaluator(Visitor):
+    '''
+    Evalua el programa para n registros a la vez. Las expresiones
+    devuelven un array de n floats (o un float, que NumPy expande).
+    '''
+
+    def __init__(self, columns, n):
+        self.n = n
+        self.env = dict(columns)    # name -> array of values
+        self.mask = None            # rows where the current branch runs
+        self.output = []            # printed strings, one array per item
+
+    @classmethod
+    def evaluate(cls, model, columns, n):
+        evaluator = cls(columns, n)
+        with np.errstate(all='ignore'):
+            model.accept(evaluator)
+        return evaluator.lines()
+
+    def lines(self):
+        if not self.output:
+            return [''] * self.n
+        out = self.output[0]
+        for item in self.output[1:]:
+            out = np.char.add(out, item)
+        return out.tolist()
+
+    # fall back if bad is true in any row that is running
+    def check(self, bad):
+        if self.mask is not None:
+            bad = bad & self.mask
+        if np.any(bad):
+            raise Fallback()
+
+    def update(self, name, new):
+        if self.mask is not None:
+            new = np.where(self.mask, new, self.env[name])
+        self.env[name] = new
+
+    def value(self, sym):
+        if sym.name not in self.env:
+            self.env[sym.name] = sym.val
+        return self.env[sym.name]
+
+    def visit(self, node: Program):
+        self.visit(node.stmts)
+
+    def visit(self, node: list):
+        for stmt in node:
+            self.visit(stmt)
+
+    def visit(self, node: Assignment):
+        sym = node.var.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            raise Fallback()
+        val = self.visit(node.expr)
+        old = self.value(sym)
+        if node.op == '=':
+            new = val
+        elif node.op in ('/=', '%='):
+            self.check(np.equal(val, 0.0))
+            new = np.divide(old, val) if node.op == '/=' else np.fmod(old, val)
+        else:
+            new = getattr(np, _arith[node.op[0]])(old, val)
+        self.update(sym.name, np.broadcast_to(new, (self.n,)))
+
+    def visit(self, node: Print):
+        for expr in node.exprs:
+            if isinstance(expr, String):
+                item = np.full(self.n, constpool.values[expr.sym.slot], dtype=object)
+            else:
+                val = np.broadcast_to(self.visit(expr), (self.n,))
+                item = np.array(['%.12g ' % v for v in val.tolist()], dtype=object)
+            if self.mask is not None:
+                item = np.where(self.mask, item, '')
+            self.output.append(item.astype(str))
+
+    def visit(self, node: If):
+        cond = np.not_equal(self.visit(node.cond), 0.0)
+        outer = self.mask
+        self.mask = cond if outer is None else outer & cond
+        self.visit(node.stmt if isinstance(node.stmt, list) else [node.stmt])
+        if node.stmt1:
+            self.mask = ~cond if outer is None else outer & ~cond
+            self.visit(node.stmt1 if isinstance(node.stmt1, list) else [node.stmt1])
+        self.mask = outer
+
+    def visit(self, node: Literal):
+        return node.sym.val
+
+    def visit(self, node: Variable):
+        sym = node.sym
+        if sym.type != 'VAR' and sym.type != 'UNDEF':
+            raise Fallback()
+        return self.value(sym)
+
+    def visit(self, node: Bltin):
+        arg = self.visit(node.expr)
+        val = getattr(np, _ufuncs[node.sym.name])(arg)
+        if node.sym.name == 'int':
+            val = val + 0.0     # int(-0.5) is 0, trunc gives -0.0
+        # math.* raises where NumPy returns nan/inf
+        self.check(np.isfinite(arg) & ~np.isfinite(val))
+        # and on some non-finite arguments: int(inf), sin(inf), sqrt(-inf), ...
+        for x in _rejected(node.sym):
+            self.check(np.isnan(arg) if x != x else np.equal(arg, x))
+        return val
+
+    def visit(self, node: Binop):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        op = node.op
+        if op in _arith:
+            return getattr(np, _arith[op])(left, right)
+        if op in _relop:
+            return getattr(np, _relop[op])(left, right).astype(float)
+        if op in ('/', '%'):
+            self.check(np.equal(right, 0.0))
+            return np.divide(left, right) if op == '/' else np.fmod(left, right)
+        if op == '^':
+            val = np.power(left, right)
+            self.check(np.isfinite(left) & np.isfinite(right) & ~np.isfinite(val))
+            return val
+        a, b = np.not_equal(left, 0.0), np.not_equal(right, 0.0)
+        return (a & b if op == '&&' else a | b).astype(float)
+
+    def visit(self, node: Unaryop):
+        val = self.visit(node.expr)
+        if node.op == '-':
+            return np.negative(val)
+        return np.equal(val, 0.0).astype(float)
+
+    def visit(self, node: Preinc):
+        return self.step(node.sym, 1.0, True)
+
+    def visit(self, node: Predec):
+        return self.step(node.sym, -1.0, True)
+
+    def visit(self, node: Postinc):
+        return self.step(node.sym, 1.0, False)
+
+    def visit(self, node: Postdec):
+        return self.step(node.sym, -1.0, False)
+
+    def step(self, sym, d, pre):
+        old = np.broadcast_to(self.value(sym), (self.n,))
+        new = old + d
+        self.update(sym.name, new)
+        return new if pre else old
+
+# input columns of a chunk of records; missing fields keep the initial value
+def columns(program, records):
+    cols = {}
+    for name, slot in program.inputs.items():
+        initial = program.initial[slot]
+        values = []
+        for record in records:
+            value = record.get(name)
+            if value is None or value == '':
+                values.append(initial)
+                continue
+            try:
+                values.append(float(value))
+            except (TypeError, ValueError):
+                raise CompilerError(f"valor no numérico para '{name}': {value!r}")
+        cols[name] = np.array(values, dtype=float)
+    return cols
+
+def run_all(model, program, records, out=None):
+    '''
+    Como program.run_all(records, out), pero evaluando `model` (el AST del
+    que se genero `program`) sobre columnas cuando se puede.
+    '''
+    if out is None:
+        out = sys.stdout
+    if np is None or not eligible(model):
+        return program.run_all(records, out)
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, CHUNK))
+        if not chunk:
+            break
+        try:
+            lines = VectorEvaluator.evaluate(model, columns(program, chunk), len(chunk))
+        except Fallback:
+            program.run_all(chunk, out)
+            continue
+        for line in lines:
+            out.write(line)
+            out.write('\n')
@@ -1,6 +1,17 @@
 # Maquina virtual
+#
+# El estado de la maquina (pila, programa, pc, variables, marcos de
+# llamada) vive en una instancia de Machine, y cada instruccion es una
+# funcion que la recibe como argumento: `prog` sigue siendo una lista de
+# funciones y operandos, pero varias maquinas pueden ejecutar a la vez.
+#
+# `machine` es la maquina por omision que usan el generador de codigo y
+# minic.py; stack, prog, data... son alias de sus listas.
+from array import array
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
-from errors import execerror
+from errors import CompilerError, execerror
+from init import constpool
 from math import fmod
 from model import *
 
@@ -8,482 +19,570 @@ DEBUG = False
 STOP  = None
 
 NSTACK = 256
-stack  = []    # the stack (pop, push)
+NPROG  = None          # default size limit of prog, None for no limit
 
-NPROG  = 2000
-prog   = []    # the machine
-pc     = 0     # program counter 
-
-progbase  = len(prog)
-returning = False       # True if return stmt seen
 indef = False           # True if parsing a func or proc
 
-# Tipos de Instrucciones en la pila/prog
-@dataclass
-class Datum:
-    val: float  = 0.0
-    sym: Symbol = None
-
 # proc/func call stack frame
 @dataclass
 class Frame:
     sp    : Symbol = None   # symbol table entry
     retpc : int = 0         # where to resume after return
-    argn  : Datum = 0       # n-th argument on stack
+    argn  : int = 0         # n-th argument on stack
     nargs : int	= 0         # number of arguments
 
 NFRAME = 100
-frame  = Stack()
 
-# initialize for code generation
-def initcode():
-    global stack, prog, frame, returning
-    stack = []
-    prog  = []
-    frame = Stack()
-    returning = False
+class LineTable:
+    '''
+    pc -> linea del fuente. pcs[i] es la primera instruccion generada
+    para la linea lines[i]; una entrada por cada cambio de linea.
+    '''
+    __slots__ = ('pcs', 'lines')
+
+    def __init__(self):
+        self.pcs   = array('i')
+        self.lines = array('i')
+
+    def __len__(self):
+        return len(self.pcs)
+
+    def __iter__(self):
+        return zip(self.pcs, self.lines)
+
+    def clear(self):
+        del self.pcs[:]
+        del self.lines[:]
+
+    # code from pc on belongs to line; pc never decreases
+    def add(self, pc, line):
+        if self.pcs and self.pcs[-1] == pc:
+            self.lines[-1] = line
+            if len(self.lines) > 1 and self.lines[-2] == line:
+                self.pcs.pop()
+                self.lines.pop()
+        elif not self.lines or self.lines[-1] != line:
+            self.pcs.append(pc)
+            self.lines.append(line)
+
+    def lookup(self, pc):
+        i = bisect_right(self.pcs, pc) - 1
+        return self.lines[i] if i >= 0 else 0
+
+    # move entries after peephole.optimize: relocated maps old pc -> new pc
+    # for every pc from start on
+    def relocate(self, relocated, start=0):
+        for i in range(bisect_left(self.pcs, start), len(self.pcs)):
+            self.pcs[i] = relocated[self.pcs[i]]
+
+class Machine:
+    '''
+    Una maquina de pila. Las variables globales ocupan un slot de `data`
+    que el generador de codigo asigna al compilar, y load/store/addeq...
+    lo reciben como operando. La pila solo guarda floats.
+    '''
+    __slots__ = ('stack', 'prog', 'pc', 'progbase', 'data', 'symbols',
+                 'frame', 'consts', 'out', 'lines', 'nprog')
+
+    def __init__(self, prog=None, data=None, symbols=None, consts=None, out=None,
+                 lines=None, nprog=NPROG):
+        self.stack    = []                  # the stack (pop, push)
+        self.prog     = [] if prog is None else prog   # the machine
+        self.pc       = 0                   # program counter
+        self.progbase = len(self.prog)      # start of current subprogram
+        self.data     = [] if data is None else data   # slot -> value
+        self.symbols  = [] if symbols is None else symbols  # slot -> Symbol
+        self.frame    = Stack()
+        self.consts   = [] if consts is None else consts    # pool slot -> value
+        self.out      = out                 # file for print, None is sys.stdout
+        self.lines    = LineTable() if lines is None else lines # pc -> source line
+        self.nprog    = nprog               # size limit of prog, None for no limit
+
+    # initialize for code generation
+    def initcode(self):
+        self.stack.clear()
+        self.prog.clear()
+        self.frame.clear()
+        self.data.clear()
+        self.symbols.clear()
+        self.lines.clear()
+        self.progbase = 0
+
+    # give sym a slot in data, initialized with its current value
+    def newslot(self, sym: Symbol) -> int:
+        self.data.append(sym.val)
+        self.symbols.append(sym)
+        return len(self.data) - 1
+
+    # run the machine: one flat loop, control flow is done by jmp/jz
+    def execute(self, p: int=0):
+        prog = self.prog
+        pc = p
+        instr = prog[p]
+        while instr is not STOP:
+            self.pc = pc + 1
+            instr(self)
+            pc = self.pc
+            instr = prog[pc]
+
+    # run at most n instructions from pc; False once the program stopped.
+    # Lets a caller interleave long programs with other work.
+    def step(self, n: int) -> bool:
+        prog = self.prog
+        pc = self.pc
+        instr = prog[pc]
+        while instr is not STOP:
+            if n == 0:
+                return True
+            n -= 1
+            self.pc = pc + 1
+            instr(self)
+            pc = self.pc
+            instr = prog[pc]
+        return False
+
+# runtime error, reported at the source line of the current instruction
+def vmerror(m, message):
+    execerror(message, m.lines.lookup(m.pc - 1) or None)
 
 # push d onto stack
-def push(d : Datum):
-    if len(stack) >= NSTACK:
-        execerror('desbordamiento de la pila')
-    stack.append(d)
+def push(m, d):
+    if len(m.stack) >= NSTACK:
+        vmerror(m, 'desbordamiento de la pila')
+    m.stack.append(d)
 
 # pop and return top elem from stack
-def pop() -> Datum:
-    if len(stack) == 0:
-        execerror('desbordamiento de la pila')
-    return stack.pop()
+def pop(m):
+    if len(m.stack) == 0:
+        vmerror(m, 'desbordamiento de la pila')
+    return m.stack.pop()
 
 # for when no value is wanted
-def xpop():
-    if len(stack) == 0:
-        execerror('desbordamiento de la pila')
-    stack.pop()
-
-# push constant onto stack
-def constpush():
-    global pc
-    d = Datum(val=prog[pc].val); pc += 1
-    push(d)
+def xpop(m):
+    if len(m.stack) == 0:
+        vmerror(m, 'desbordamiento de la pila')
+    m.stack.pop()
+
+# push constant onto stack (push() inlined: these two run the most)
+def constpush(m):
+    stack = m.stack
+    if len(stack) >= NSTACK:
+        vmerror(m, 'desbordamiento de la pila')
+    stack.append(m.consts[m.prog[m.pc]]); m.pc += 1
 
 # push variable onto stack
-def varpush():
-    global pc
-    d = Datum(sym=prog[pc]); pc += 1
-    push(d)
-
-def whilecode():
-    global pc
-    savepc = pc                 # loop body
-
-    execute(savepc+2)           # condition
-    d = pop()
-    while d.val:
-        execute(savepc)         # body
-        if returning: break
-        execute(savepc+2)
-        d = pop()
-
-    if not returning:
-        pc = prog[savepc+1]     # next statement
-
-def forcode():
-    global pc
-    savepc = pc
-
-    execute(savepc+4)           # precharge
-    pop()
-    execute(savepc)             # condiction
-    d = pop()
-    while d.val:
-        execute(savepc+2)       # body
-        if returning: break
-        execute(savepc+1)       # post loop
-        pop()
-        execute(savepc)         # condiction
-        d = pop()
-
-    if not returning:
-        pc = prog[savepc+3]     # next statement
-
-def ifcode():
-    global pc
-    savepc = pc                 # then part
-
-    execute(savepc+3)           # condition
-    d = pop()
-    if d.val:
-        execute(savepc)
-    elif prog[savepc+1]:        # else part?
-        execute(savepc+1)
-
-    if not returning:
-        pc = prog[savepc+2]     # next statement
+def load(m):
+    stack = m.stack
+    if len(stack) >= NSTACK:
+        vmerror(m, 'desbordamiento de la pila')
+    stack.append(m.data[m.prog[m.pc]]); m.pc += 1
+
+# store top of stack in variable, leave it on the stack
+def store(m):
+    m.data[m.prog[m.pc]] = m.stack[-1]; m.pc += 1
+
+def jmp(m):
+    m.pc = m.prog[m.pc]
+
+# jump if top of stack is zero
+def jz(m):
+    if m.stack.pop():
+        m.pc += 1
+    else:
+        m.pc = m.prog[m.pc]
 
 # put func/proc in symbol table
-def define(sp: Symbol):
-    global progbase
-    sp.defn  = progbase         # start of code
-    progbase = len(prog)        # next code starts here
+def define(sp: Symbol, m=None):
+    if m is None:
+        m = machine
+    sp.defn  = m.progbase       # start of code
+    m.progbase = len(m.prog)    # next code starts here
 
 # call a function
-def call():
-    global returning
-    sp = prog[pc]               # symbol table entry for function
-    if len(frame) >= NFRAME:
-        execerror(f"{sp.name} call nested too deeply")
+def call(m):
+    sp = m.prog[m.pc]           # symbol table entry for function
+    if len(m.frame) >= NFRAME:
+        vmerror(m, f"{sp.name} call nested too deeply")
     fp = Frame()
     fp.sp = sp
-    fp.nargs = prog[pc+1]
-    fp.retpc = pc + 2
-    fp.argn  = len(stack) - 1   # last argument
-    frame.push(fp)
-    execute(sp.defn)
-    returning = False
+    fp.nargs = m.prog[m.pc+1]
+    fp.retpc = m.pc + 2
+    fp.argn  = len(m.stack) - 1 # last argument
+    m.frame.push(fp)
+    m.pc = sp.defn
 
 # common return from func/proc
-def ret():
-    global returning, pc
-    fp = frame.pop()
+def ret(m):
+    fp = m.frame.pop()
     for _ in range(fp.nargs):
-        pop()                   # pop arguments
-    pc = fp.retpc
-    returning = False
+        pop(m)                  # pop arguments
+    m.pc = fp.retpc
 
 # return from a function
-def funcret():
-    fp = frame.peek()
+def funcret(m):
+    fp = m.frame.peek()
     if fp.sp.type == 'PROCEDURE':
-        execerror(f"{fp.sp.name} (proc) returns value")
-    d = pop()                   # preserve function return value
-    ret()
-    push(d)
+        vmerror(m, f"{fp.sp.name} (proc) returns value")
+    d = pop(m)                  # preserve function return value
+    ret(m)
+    push(m, d)
 
 # return from a procedure
-def procret():
-    fp = frame.peek()
+def procret(m):
+    fp = m.frame.peek()
     if fp.sp.type == 'FUNCTION':
-        execerror(f"{fp.sp.name} (func) returns no value")
-    ret()
+        vmerror(m, f"{fp.sp.name} (func) returns no value")
+    ret(m)
 
 # return pointer to argument
-def getarg() -> int:
-    global pc
-    fp = frame.peek()
-    nargs = prog[pc]; pc += 1
+def getarg(m) -> int:
+    fp = m.frame.peek()
+    nargs = m.prog[m.pc]; m.pc += 1
     if nargs > fp.nargs:
-        execerror(f"{fp.sp.name} no hay suficientes argumentos")
+        vmerror(m, f"{fp.sp.name} no hay suficientes argumentos")
     return fp.argn + nargs - fp.nargs
 
 # push argument onto stack
-def arg():
-    d = Datum()
-    d.val = stack[getarg()].val
-    push(d)
+def arg(m):
+    push(m, m.stack[getarg(m)])
 
 # store top of stack in argument
-def argassign():
-    d = pop()
-    push(d)                     # leave value on stack
-    stack[getarg()].val = d.val
+def argassign(m):
+    m.stack[getarg(m)] = m.stack[-1] # leave value on stack
 
 # evaluate built-in on top of stack
-def bltin():
-    global pc
-    d = pop()
-    d.val = prog[pc].ptr(d.val); pc += 1
-    push(d)
-
-# evaluate variable on stack
-def eval():
-    d = pop()
-    verify(d.sym)
-    d.val = d.sym.val
-    push(d)
+def bltin(m):
+    m.stack[-1] = m.prog[m.pc].ptr(m.stack[-1]); m.pc += 1
 
 # add top two elems on stack
-def add():
-    d2 = pop()
-    d1 = pop()
-    d1.val += d2.val
-    push(d1)
+def add(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] += d2
 
 # subtract top of stack from next
-def sub():
-    d2 = pop()
-    d1 = pop()
-    d1.val -= d2.val
-    push(d1)
-
-def mul():
-    d2 = pop()
-    d1 = pop()
-    d1.val *= d2.val
-    push(d1)
-
-def div():
-    d2 = pop()
-    if d2.val == 0.0:
-        execerror('division por cero')
-    d1 = pop()
-    d1.val /= d2.val
-    push(d1)
-
-def idiv():
-    d2 = pop()
-    if d2.val == 0.0:
-        execerror('division por cero')
-    d1 = pop()
-    d1.val //= d2.val
-    push(d1)
-
-def mod():
-    d2 = pop()
-    if d2.val == 0.0:
-        execerror('division por cero')
-    d1 = pop()
-    #d1.val %= d2.val
-    d1.val = fmod(d1.val, d2.val)
-    push(d1)
-
-def negate():
-    d = pop()
-    d.val = -d.val
-    push(d)
-
-def verify(s : Symbol):
-    if s.type != 'VAR' and s.type != 'UNDEF':
-        execerror(f"intento de evaluar una no variable '{s.name}'")
-    if s.type == 'UNDEF':
-        execerror(f"variable no definida '{s.name}'")
-
-def preinc():
-    global pc
-    d = Datum(sym=prog[pc]); pc += 1
-    verify(d.sym)
-    d.sym.val += 1.0
-    d.val = d.sym.val
-    push(d)
-
-def predec():
-    global pc
-    d = Datum(sym=prog[pc]); pc += 1
-    verify(d.sym)
-    d.sym.val -= 1.0
-    d.val = d.sym.val
-    push(d)
-
-def postinc():
-    global pc
-    d = Datum(sym=prog[pc]); pc += 1
-    verify(d.sym)
-    v = d.sym.val
-    d.sym.val += 1.0
-    d.val = v
-    push(d)
-
-def postdec():
-    global pc
-    d = Datum(sym=prog[pc]); pc += 1
-    verify(d.sym)
-    v = d.sym.val
-    d.sym.val -= 1.0
-    d.val = v
-    push(d)
-
-def gt():
-    d2 = pop()
-    d1 = pop()
-    d1.val = float(d1.val > d2.val)
-    push(d1)
-
-def lt():
-    d2 = pop()
-    d1 = pop()
-    d1.val = float(d1.val < d2.val)
-    push(d1)
-
-def ge():
-    d2 = pop()
-    d1 = pop();
-    d1.val = float(d1.val >= d2.val)
-    push(d1)
-
-def le():
-    d2 = pop()
-    d1 = pop()
-    d1.val = float(d1.val <= d2.val)
-    push(d1)
-
-def eq():
-    d2 = pop()
-    d1 = pop()
-    d1.val = float(d1.val == d2.val)
-    push(d1)
-
-def ne():
-    d2 = pop()
-    d1 = pop()
-    d1.val = float(d1.val != d2.val)
-    push(d1)
-
-def and_():
-    d2 = pop()
-    d1 = pop()
-    d1.val = float(d1.val != 0.0 and d2.val != 0.0)
-    push(d1)
-
-def or_():
-    d2 = pop()
-    d1 = pop()
-    d1.val = float(d1.val != 0.0 or d2.val != 0.0)
-    push(d1)
-
-def not_():
-    d = pop();
-    d.val = float(d.val == 0.0)
-    push(d)
-
-def power():
-    d2 = pop()
-    d1 = pop()
-    d1.val = pow(d1.val, d2.val)
-    push(d1)
-
-# assign top value to next value
-def assign():
-    d1 = pop()
-    d2 = pop()
-    if d1.sym.type != 'VAR' and d1.sym.type != 'UNDEF':
-        execerror(f'asignacion a no variable {d1.sym.name}')
-    d1.sym.val  = d2.val
-    d1.sym.type = 'VAR'
-    push(d2)
-
-def addeq():
-    d1 = pop()
-    d2 = pop()
-    if d1.sym.type != 'VAR' and d1.sym.type != 'UNDEF':
-        execerror(f'asignacion a no variable {d1.sym.name}')
-    d1.sym.val += d2.val
-    d2.val = d1.sym.val
-    d1.sym.type = 'VAR'
-    push(d2)
-
-def subeq():
-    d1 = pop()
-    d2 = pop()
-    if d1.sym.type != 'VAR' and d1.sym.type != 'UNDEF':
-        execerror(f'asignacion a no variable {d1.sym.name}')
-    d1.sym.val -= d2.val
-    d2.val = d1.sym.val
-    d1.sym.type = 'VAR'
-    push(d2)
-
-def muleq():
-    d1 = pop()
-    d2 = pop()
-    if d1.sym.type != 'VAR' and d1.sym.type != 'UNDEF':
-        execerror(f'asignacion a no variable {d1.sym.name}')
-    d1.sym.val *= d2.val
-    d2.val = d1.sym.val
-    d1.sym.type = 'VAR'
-    push(d2)
-
-def diveq():
-    d1 = pop()
-    d2 = pop()
-    if d1.sym.type != 'VAR' and d1.sym.type != 'UNDEF':
-        execerror(f'asignacion a no variable {d1.sym.name}')
-    d1.sym.val /= d2.val
-    d2.val = d1.sym.val
-    d1.sym.type = 'VAR'
-    push(d2)
-
-def modeq():
-    d1 = pop()
-    d2 = pop()
-    if d1.sym.type != 'VAR' and d1.sym.type != 'UNDEF':
-        execerror(f'asignacion a no variable {d1.sym.name}')
-    d1.sym.val %= d2.val
-    d2.val = d1.sym.val
-    d1.sym.type = 'VAR'
-    push(d2)
+def sub(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] -= d2
+
+def mul(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] *= d2
+
+def div(m):
+    stack = m.stack
+    d2 = stack.pop()
+    if d2 == 0.0:
+        vmerror(m, 'division por cero')
+    stack[-1] /= d2
+
+def idiv(m):
+    stack = m.stack
+    d2 = stack.pop()
+    if d2 == 0.0:
+        vmerror(m, 'division por cero')
+    stack[-1] //= d2
+
+def mod(m):
+    stack = m.stack
+    d2 = stack.pop()
+    if d2 == 0.0:
+        vmerror(m, 'division por cero')
+    stack[-1] = fmod(stack[-1], d2)
+
+def negate(m):
+    m.stack[-1] = -m.stack[-1]
+
+def preinc(m):
+    slot = m.prog[m.pc]; m.pc += 1
+    m.data[slot] += 1.0
+    push(m, m.data[slot])
+
+def predec(m):
+    slot = m.prog[m.pc]; m.pc += 1
+    m.data[slot] -= 1.0
+    push(m, m.data[slot])
+
+def postinc(m):
+    slot = m.prog[m.pc]; m.pc += 1
+    push(m, m.data[slot])
+    m.data[slot] += 1.0
+
+def postdec(m):
+    slot = m.prog[m.pc]; m.pc += 1
+    push(m, m.data[slot])
+    m.data[slot] -= 1.0
+
+def gt(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] = 1.0 if stack[-1] > d2 else 0.0
+
+def lt(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] = 1.0 if stack[-1] < d2 else 0.0
+
+def ge(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] = 1.0 if stack[-1] >= d2 else 0.0
+
+def le(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] = 1.0 if stack[-1] <= d2 else 0.0
+
+def eq(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] = 1.0 if stack[-1] == d2 else 0.0
+
+def ne(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] = 1.0 if stack[-1] != d2 else 0.0
+
+def and_(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] = 1.0 if stack[-1] != 0.0 and d2 != 0.0 else 0.0
+
+def or_(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] = 1.0 if stack[-1] != 0.0 or d2 != 0.0 else 0.0
+
+def not_(m):
+    m.stack[-1] = 1.0 if m.stack[-1] == 0.0 else 0.0
+
+def power(m):
+    stack = m.stack
+    d2 = stack.pop()
+    stack[-1] = pow(stack[-1], d2)
+
+# variable op= top of stack, leave the new value on stack
+def addeq(m):
+    slot = m.prog[m.pc]; m.pc += 1
+    m.data[slot] += m.stack[-1]
+    m.stack[-1] = m.data[slot]
+
+def subeq(m):
+    slot = m.prog[m.pc]; m.pc += 1
+    m.data[slot] -= m.stack[-1]
+    m.stack[-1] = m.data[slot]
+
+def muleq(m):
+    slot = m.prog[m.pc]; m.pc += 1
+    m.data[slot] *= m.stack[-1]
+    m.stack[-1] = m.data[slot]
+
+def diveq(m):
+    slot = m.prog[m.pc]; m.pc += 1
+    m.data[slot] /= m.stack[-1]
+    m.stack[-1] = m.data[slot]
+
+def modeq(m):
+    slot = m.prog[m.pc]; m.pc += 1
+    if m.stack[-1] == 0.0:
+        vmerror(m, 'division por cero')
+    m.data[slot] = fmod(m.data[slot], m.stack[-1])
+    m.stack[-1] = m.data[slot]
 
 # pop top value from stack, print it
-def printtop():
+def printtop(m):
     global s # last value computed
     if not s in globals():
         s = install('_', 'VAR', 0.0)
-    d = pop()
-    print('\t%.12g' % d.val)
-    s.val = d.val
+    d = pop(m)
+    print('\t%.12g' % d, file=m.out)
+    s.val = d
+
+# Superinstrucciones: las genera peephole.optimize() fusionando
+# secuencias frecuentes, para despachar menos instrucciones por cada
+# operación del programa fuente.
+
+# store; pop  - assignment used as a statement
+def storepop(m):
+    m.data[m.prog[m.pc]] = m.stack.pop(); m.pc += 1
+
+# preinc/postinc; xpop  - ++/-- used as a statement
+def incvar(m):
+    m.data[m.prog[m.pc]] += 1.0; m.pc += 1
+
+def decvar(m):
+    m.data[m.prog[m.pc]] -= 1.0; m.pc += 1
+
+# constpush; add  - operate with a constant from the pool
+def addconst(m):
+    m.stack[-1] += m.consts[m.prog[m.pc]]; m.pc += 1
+
+def subconst(m):
+    m.stack[-1] -= m.consts[m.prog[m.pc]]; m.pc += 1
+
+def mulconst(m):
+    m.stack[-1] *= m.consts[m.prog[m.pc]]; m.pc += 1
+
+# lt; jz  - compare the top two values, jump unless the comparison holds
+def jnlt(m):
+    stack = m.stack
+    d2 = stack.pop()
+    if stack.pop() < d2:
+        m.pc += 1
+    else:
+        m.pc = m.prog[m.pc]
+
+def jnle(m):
+    stack = m.stack
+    d2 = stack.pop()
+    if stack.pop() <= d2:
+        m.pc += 1
+    else:
+        m.pc = m.prog[m.pc]
+
+def jngt(m):
+    stack = m.stack
+    d2 = stack.pop()
+    if stack.pop() > d2:
+        m.pc += 1
+    else:
+        m.pc = m.prog[m.pc]
+
+def jnge(m):
+    stack = m.stack
+    d2 = stack.pop()
+    if stack.pop() >= d2:
+        m.pc += 1
+    else:
+        m.pc = m.prog[m.pc]
+
+def jneq(m):
+    stack = m.stack
+    d2 = stack.pop()
+    if stack.pop() == d2:
+        m.pc += 1
+    else:
+        m.pc = m.prog[m.pc]
+
+def jnne(m):
+    stack = m.stack
+    d2 = stack.pop()
+    if stack.pop() != d2:
+        m.pc += 1
+    else:
+        m.pc = m.prog[m.pc]
 
 # print numeric value
-def prexpr():
-    d = pop()
-    print('%.12g ' % d.val, end='')
+def prexpr(m):
+    print('%.12g ' % m.stack.pop(), end='', file=m.out)
 
 # print string value
-def prstr():
-    global pc
-    s = prog[pc].replace('\\n', '\n'); pc += 1
-    print(f"{s}", end='')
+def prstr(m):
+    s = m.consts[m.prog[m.pc]]; m.pc += 1
+    print(s, end='', file=m.out)
 
 # read into variable
-def varread():
-    global pc
-    d = Datum()
-    var = prog[pc]; pc += 1
+def varread(m):
+    slot = m.prog[m.pc]; m.pc += 1
     try:
-        var.val = float(input('$ '))
+        m.data[slot] = float(input('$ '))
     except EOFError:
-        d.val = var.val = 0.0
+        m.data[slot] = 0.0
     except ValueError:
-        execerror(f"no número leido en {var.name}")
-    finally:
-        d.val = 1.0
-    var.type = 'VAR'
-    push(d)
+        vmerror(m, f"no número leido en {m.symbols[slot].name}")
+    push(m, 1.0)
+
+# the default machine; its constants are those of init.constpool
+machine = Machine(consts=constpool.values)
+
+stack   = machine.stack
+prog    = machine.prog
+data    = machine.data
+symbols = machine.symbols
+frame   = machine.frame
+consts  = machine.consts
+
+def initcode():
+    machine.initcode()
+
+def newslot(sym: Symbol) -> int:
+    return machine.newslot(sym)
 
-# run the machine
 def execute(p: int=0):
-    global pc
-    pc = p
-    while prog[pc] is not STOP:
-        if isinstance(prog[pc], int): pc = prog[pc]
-        instr = prog[pc]; pc += 1
-        instr()
-
-def pprint(line, instr):
+    machine.execute(p)
+
+def pprint(line, instr, *operands, m=None):
+    if m is None:
+        m = machine
     if instr is None:
         cmd = 'STOP'
     elif isinstance(instr, Symbol):
-        if instr.type == 'NUMBER':
-            cmd = f'{instr.val} -> NUMBER'
-        elif instr.type == 'STRING':
-            cmd = instr.str
-        else:
-            cmd = instr.name
+        cmd = instr.name
     elif isinstance(instr, (int, str)):
         cmd = instr
     else:
         cmd = instr.__name__
-    print(line, '\t', cmd)
+    if instr in _const_instr:
+        operands = [f'[{slot}] {m.consts[slot]!r}' for slot in operands]
+    elif instr in _slot_instr:
+        operands = [m.symbols[slot].name for slot in operands]
+    else:
+        operands = [o.name if isinstance(o, Symbol) else o for o in operands]
+    print(line, '\t', cmd, *operands)
+
+# operand cells that follow each instruction in prog
+_noperands = {
+    constpush: 1, load: 1, store: 1, prstr: 1, bltin: 1, varread: 1,
+    preinc: 1, predec: 1, postinc: 1, postdec: 1, arg: 1, argassign: 1,
+    addeq: 1, subeq: 1, muleq: 1, diveq: 1, modeq: 1,
+    call: 2, jmp: 1, jz: 1,
+    storepop: 1, incvar: 1, decvar: 1, addconst: 1, subconst: 1, mulconst: 1,
+    jnlt: 1, jnle: 1, jngt: 1, jnge: 1, jneq: 1, jnne: 1,
+}
+
+# instructions whose operand is a data slot
+_slot_instr = {
+    load, store, varread, preinc, predec, postinc, postdec,
+    addeq, subeq, muleq, diveq, modeq, storepop, incvar, decvar,
+}
+
+# instructions whose operand is a constant pool slot
+_const_instr = {
+    constpush, prstr, addconst, subconst, mulconst,
+}
+
+# instructions whose operand is a jump target
+_jump_instr = {
+    jmp, jz, jnlt, jnle, jngt, jnge, jneq, jnne,
+}
+
+# list the program, one instruction and its operands per line
+def dump(m=None):
+    if m is None:
+        m = machine
+    line = 0
+    while line < len(m.prog):
+        instr = m.prog[line]
+        n = _noperands.get(instr, 0)
+        pprint(line, instr, *m.prog[line+1:line+1+n], m=m)
+        line += 1 + n
 
 # install one instruction or operand
-def code(f):
-    if len(prog) >= NPROG:
-        execerror('programa muy grande')
+def code(f, m=None):
+    if m is None:
+        m = machine
+    prog = m.prog
+    if m.nprog is not None and len(prog) >= m.nprog:
+        raise CompilerError('programa muy grande')
     prog.append(f)
     return len(prog) - 1
 
-def code2(c1, c2):
-    ret = code(c1); code(c2)
+def code2(c1, c2, m=None):
+    ret = code(c1, m); code(c2, m)
     return ret
 
-def code3(c1, c2, c3): 
-    ret = code(c1); code(c2); code(c3)
+def code3(c1, c2, c3, m=None):
+    ret = code(c1, m); code(c2, m); code(c3, m)
     return ret
-